@@ -1,10 +1,21 @@
 import math
+import numpy as np
 
 
 from Synth.osc import wtOsc
 from Synth.envelope import envelope
 import Synth.filt
 
+# Precomputed single periods of the LFO waveforms used in block mode,
+# before amount and offset are applied
+TABLE_SIZE = 4096
+_table_phase = np.arange(TABLE_SIZE) * (2 * math.pi / TABLE_SIZE)
+TABLES = {
+    'sin': np.sin(_table_phase),
+    'square': np.where(_table_phase <= math.pi, 0.0, 1.0),
+    'saw': (-1/math.pi)*_table_phase + 1,
+}
+
 class lfo:
 
     def __init__(self, synth, samplerate=44100, device=None, control=None,
@@ -35,11 +46,22 @@ class lfo:
         self.enable = True
         self.retrig = False
 
+        # Block mode: samples between control points, and whether to
+        # hold or linearly interpolate between them. The block engines
+        # only ramp controls that take one value per sample (see
+        # Synth.modmatrix); others are held either way.
+        self.control_period = 64
+        self.interpolate = False
+
 
     def set_device_control(self, device, control):
         self.device = device
         self.control = control
 
+        # Routing changed, the synth's compiled routes are stale
+        if 'matrix' in getattr(self.synth, '__dict__', {}):
+            self.synth.matrix.invalidate()
+
 
     def get_retrig(self):
         if self.retrig == True:
@@ -62,6 +84,78 @@ class lfo:
         self.phaseInc = (speed/self.samplerate)*self.period
 
 
+    def genControl(self, n, period=None):
+        '''
+            Generates the LFO output at the control points of a block of n
+            samples, one every period samples starting with the first
+            sample, by looking the phase up in the precomputed waveform
+            tables. The phase is then advanced across the whole block, so
+            it carries on from the previous block (or from a retrigger)
+            exactly as it does per sample.
+
+                Args:
+                    n: (int) the number of samples in the block
+
+                    period=None: (int) samples between control points,
+                        defaults to control_period
+
+                Returns:
+                    (ndarray) of ceil(n/period) floats, the LFO output at
+                    each control point
+        '''
+        if period == None:
+            period = self.control_period
+
+        values = self._lookup(np.arange(0, n, period))
+
+        self.phase = self.phase + n * self.phaseInc
+        if self.phase > self.period:
+            self.phase = self.phase%self.period
+
+        return values
+
+
+    def genBlock(self, n):
+        '''
+            Generates the LFO output for a block of n samples. Values are
+            computed at control points every control_period samples by
+            genControl and held or, if interpolate is set, linearly
+            interpolated in between.
+
+                Args:
+                    n: (int) the number of samples in the block
+
+                Returns:
+                    (ndarray) of n floats, the LFO output for each sample
+        '''
+        if self.interpolate:
+            # Extra point at the start of the next block to ramp towards
+            end = self._lookup(np.array([n]))
+            values = self.genControl(n)
+            offsets = np.arange(0, n + self.control_period,
+                                self.control_period)[:len(values) + 1]
+            offsets[-1] = n
+            return np.interp(
+                np.arange(n), offsets, np.append(values, end)
+            )
+        else:
+            values = self.genControl(n)
+            return np.repeat(values, self.control_period)[:n]
+
+
+    def _lookup(self, offsets):
+        '''
+            Looks up the LFO output at sample offsets from the current
+            phase in the waveform tables.
+        '''
+        # The phase is advanced before every sample is generated
+        phase = self.phase + (offsets + 1) * self.phaseInc
+        index = (phase * (TABLE_SIZE / self.period)).astype(np.intp)
+        np.mod(index, TABLE_SIZE, out=index)
+
+        return TABLES[self.wavetype][index] * self.amount + self.offset
+
+
     def update_control(self, device=None, control=None):
         '''
             This function updates the desired control based on a float
@@ -88,8 +182,26 @@ class lfo:
         if control == None:
             return
 
-        scale = self.genOutput()
+        self.apply_control(self.genOutput(), device, control)
 
+
+    def apply_control(self, scale, device=None, control=None):
+        '''
+            This function sets the desired control from an LFO output
+            value.
+
+                Args:
+                    scale,          float, the LFO output, clipped to
+                                    -1 to 1
+
+                    device=None,    str, name of the device to control
+
+                    control=None,   str, name of the control to modulate
+
+                Returns:
+                    None
+
+        '''
         if scale > 1:
             scale = 1
         elif scale < -1:
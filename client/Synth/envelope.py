@@ -1,4 +1,5 @@
 import math
+import numpy as np
 
 class envelope:
     '''
@@ -126,6 +127,69 @@ class envelope:
             return 0
 
 
+    def render(self, note_samples, start, n):
+        '''
+        This function outputs the scaling factors for a block of samples of
+        a note at once. The gain follows the same attack, decay, sustain
+        and release segments as gen_env; each segment is evaluated over
+        the whole block from its breakpoints, with earlier segments taking
+        precedence the same way as in gen_env.
+
+        note_samples and start can also be arrays shaped (voices, 1) to
+        render several voices at once, giving a (voices, n) result.
+
+            Args:
+                note_samples: (float) the length of the note in samples,
+                    used to size the sustain segment
+                start: (int) the sample number in the note of the first
+                    sample of the block
+                n: (int) the number of samples in the block
+
+            Returns:
+                (ndarray) of n floats corresponding to the gain of each sample
+        '''
+        t = np.add(start, np.arange(n), dtype=float)
+
+        if self.enable == False:
+            return np.ones(t.shape)
+
+        attack = self.attacksamples
+        decay = self.decaysamples
+        release = self.releasesamples
+        sustain = np.maximum(note_samples - attack - decay - release, 0)
+
+        gain = np.zeros(np.broadcast(t, sustain).shape)
+
+        # Segments are filled last to first so the earlier segment wins
+        # where two conditions hold, like the if chain in gen_env.
+
+        # release curve
+        if not release == 0:
+            sample = t - decay - attack - sustain
+            gain = np.where(
+                sample <= release,
+                (-self.sustain_amp/release)*sample + self.sustain_amp,
+                gain
+            )
+
+        # sustain curve
+        gain[(t - decay - attack) < sustain] = self.sustain_amp
+
+        # decay curve
+        if not decay == 0:
+            gain = np.where(
+                (t - attack) < decay,
+                ((self.sustain_amp - 1)/decay) * (t - attack) + 1,
+                gain
+            )
+
+        # attack curve
+        if not attack == 0:
+            gain = np.where(t < attack, t/attack, gain)
+
+        return gain
+
+
     def gen_env_graph(self, curr_sample, inp):
         '''
         This function outputs the scaling factor based on the current sample
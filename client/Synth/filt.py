@@ -1,4 +1,5 @@
 import math
+import numpy as np
 
 
 class filter:
@@ -7,6 +8,7 @@ class filter:
         self.samplerate = samplerate
         self.filtertype = 'High_Pass'
         self.past_output = 0
+        self.past_input = 0
         self.enable = True
 
         # min max and step used by LFO
@@ -40,6 +42,8 @@ class filter:
 
 
     def generate_output(self, inp):
+        self.past_input = inp[1]
+
         if self.enable == False:
             return inp[1]
 
@@ -56,3 +60,63 @@ class filter:
             self.past_output = output
             output = math.floor(output)
             return output
+
+
+    def process_block(self, x):
+        '''
+            Runs the filter over a whole block of input samples. The
+            previous input sample and past output are carried over between
+            blocks, so the output is identical to calling generate_output
+            once per sample.
+
+            The cutoff can also have been set to an array with one cutoff
+            per sample of the block, to sweep it across the block.
+
+                Args:
+                    x: (ndarray) block of input samples
+
+                Returns:
+                    (ndarray) of the filtered samples
+        '''
+        x = np.asarray(x, dtype=float)
+        if len(x) == 0:
+            return x.copy()
+
+        prev = self.past_input
+        self.past_input = x[-1]
+
+        if self.enable == False:
+            return x.copy()
+
+        past = self.past_output
+        output = []
+        append = output.append
+
+        if self.filtertype == 'High_Pass':
+            alpha = self.alpha_hp
+            if np.ndim(alpha) == 0:
+                for cur in x.tolist():
+                    past = alpha * (past + prev - cur)
+                    append(past)
+                    prev = cur
+            else:
+                for cur, alpha in zip(x.tolist(), alpha.tolist()):
+                    past = alpha * (past + prev - cur)
+                    append(past)
+                    prev = cur
+
+        elif self.filtertype == 'Low_Pass':
+            alpha = self.alpha_lp
+            if np.ndim(alpha) == 0:
+                for cur in x.tolist():
+                    past = past + (alpha *(prev - past))
+                    append(past)
+                    prev = cur
+            else:
+                for cur, alpha in zip(x.tolist(), alpha.tolist()):
+                    past = past + (alpha *(prev - past))
+                    append(past)
+                    prev = cur
+
+        self.past_output = past
+        return np.floor(output)
@@ -0,0 +1,275 @@
+import numpy as np
+
+
+class modmatrix:
+    '''
+        This class is the modulation matrix of the synth. It resolves the
+        route of every LFO (the LFO, the device and the control it
+        modulates) once into a direct setter with the output range and
+        clamp of the control precomputed. The block engine then turns the
+        LFO outputs for a whole block into control values with one
+        vectorized operation and only calls the setters.
+
+        The routes are only rebuilt after an LFO's device or control
+        changes (lfo.set_device_control calls invalidate).
+
+        Controls that can follow a ramp of values, one per sample
+        (oscillator volume and filter cutoff), have setters marked with
+        ramps = True. The routes to them from LFOs with interpolate set
+        are ramped linearly between control points; every other route is
+        held from one control point to the next.
+
+        LFO output s (-1 to 1) is mapped to a control value with
+            value = base + gain * s
+        and then clamped to the control's min and max.
+
+            Args:
+                synth: (synth) the synth whose LFOs and devices are routed
+
+                lfos=('lfo1', 'lfo2', 'lfo3'): (tuple) names of the LFOs
+                    of the synth
+
+            Returns:
+                None
+    '''
+
+    def __init__(self, synth, lfos=('lfo1', 'lfo2', 'lfo3')):
+        self.synth = synth
+        self.lfos = lfos
+        self.dirty = True
+
+        self.route_lfos = []
+        self.setters = []
+        self.base = np.zeros(0)
+        self.gain = np.zeros(0)
+        self.lo = np.zeros(0)
+        self.hi = np.zeros(0)
+
+
+    def invalidate(self):
+        '''
+            Marks the routes as changed, they are rebuilt on next use.
+        '''
+        self.dirty = True
+
+
+    def build(self):
+        '''
+            Resolves the current route of every LFO.
+        '''
+        routes = []
+        for name in self.lfos:
+            lfo = self.synth.__dict__[name]
+            route = self._resolve(lfo.device, lfo.control)
+            if not route == None:
+                routes.append((lfo,) + route)
+
+        self.route_lfos = [i[0] for i in routes]
+        self.base = np.array([i[1] for i in routes], dtype=float)
+        self.gain = np.array([i[2] for i in routes], dtype=float)
+        self.lo = np.array([i[3] for i in routes], dtype=float)
+        self.hi = np.array([i[4] for i in routes], dtype=float)
+        self.setters = [i[5] for i in routes]
+        self.dirty = False
+
+
+    def active(self):
+        '''
+            Tells whether any enabled LFO modulates a control.
+
+                Returns:
+                    (bool)
+        '''
+        if self.dirty:
+            self.build()
+
+        return any(lfo.enable == True for lfo in self.route_lfos)
+
+
+    def modulates(self, devices):
+        '''
+            Tells whether any enabled LFO modulates a control of one of
+            the devices.
+
+                Args:
+                    devices: (tuple) names of devices in the synth
+
+                Returns:
+                    (bool)
+        '''
+        if self.dirty:
+            self.build()
+
+        return any(
+            lfo.enable == True and lfo.device in devices
+            for lfo in self.route_lfos
+        )
+
+
+    def render(self, n):
+        '''
+            Generates the control values of every active route for a block
+            of n samples, advancing the routed LFOs across the block.
+
+                Args:
+                    n: (int) the number of samples in the block
+
+                Returns:
+                    (values, setters, period, ramps):
+                        values (ndarray) routes x control points + 1, one
+                            control point every period samples and, last,
+                            the value at the first sample of the next block
+                        setters (list) of functions taking one control value,
+                            one for each row of values
+                        period (int) samples between control points
+                        ramps (list) of bools, True for the routes to be
+                            ramped between control points; their setters
+                            also take an array of values, one per sample
+        '''
+        if self.dirty:
+            self.build()
+
+        active = [
+            i for i, lfo in enumerate(self.route_lfos) if lfo.enable == True
+        ]
+        if not active:
+            return None, [], n, []
+
+        period = min(self.route_lfos[i].control_period for i in active)
+        values = np.array([
+            np.append(
+                self.route_lfos[i]._lookup(np.array([n])),
+                self.route_lfos[i].genControl(n, period)
+            ) for i in active
+        ])
+        # The value at the next block was looked up first, before the
+        # phase moved on, and goes last
+        values = np.roll(values, -1, axis=1)
+
+        np.clip(values, -1, 1, out=values)
+        values *= self.gain[active, None]
+        values += self.base[active, None]
+        np.clip(values, self.lo[active, None], self.hi[active, None],
+                out=values)
+
+        setters = [self.setters[i] for i in active]
+        ramps = [
+            self.route_lfos[i].interpolate == True
+            and getattr(self.setters[i], 'ramps', False)
+            for i in active
+        ]
+        return values, setters, period, ramps
+
+
+    def _resolve(self, device, control):
+        '''
+            Resolves one route.
+
+                Args:
+                    device: (str) name of the device in the synth
+                    control: (str) name of the control
+
+                Returns:
+                    (base, gain, lo, hi, setter), or None if the route does
+                    not modulate anything
+        '''
+        if device == None or control == None:
+            return None
+
+        target = self.synth.__dict__[device]
+
+        if device == 'oscil' or device == 'oscil2':
+            if control == 'wavtable position':
+                # Goes to 0 - 1 and is scaled to a frame by the setter,
+                # since the number of frames changes with the wavetable
+                def set_frame(value):
+                    frame = int(value * target.wavetablepos_max)
+                    target.wavetablepos = frame * target.wavetsize
+                return (0.5, 0.5, 0, 1, set_frame)
+
+            if control == 'detune':
+                return (
+                    0, target.detune_max,
+                    target.detune_min, target.detune_max,
+                    self._attr_setter(target, 'detune')
+                )
+
+            if control == 'volume':
+                # genBank scales by volume, so an array ramps it
+                setter = self._attr_setter(target, 'volume')
+                setter.ramps = True
+                return (
+                    0.5, 0.5,
+                    target.volume_min, target.volume_max, setter
+                )
+
+        if device == 'env1' or device == 'env2':
+            if control in ('attack', 'decay', 'release'):
+                top = target.__dict__[control + '_max']
+                return (
+                    top/2, top/2,
+                    target.__dict__[control + '_min'], top,
+                    getattr(target, 'set_' + control)
+                )
+
+            if control == 'sustainamp':
+                return (
+                    0.5, 0.5,
+                    target.sustain_amp_min, target.sustain_amp_max,
+                    target.set_sustain
+                )
+
+        if device == 'fil1' or device == 'fil2':
+            if control == 'cutoff':
+                # The filter type can change while routed, so the setter
+                # picks the range for the current type. An array of
+                # cutoffs gives process_block an alpha for every sample.
+                def set_cutoff(value):
+                    if target.filtertype == 'Low_Pass':
+                        lo = target.set_cutoff_lowpass_min
+                        hi = target.set_cutoff_lowpass_max
+                        setter = target.set_cutoff_lowpass
+                    else:
+                        lo = target.set_cutoff_highpass_min
+                        hi = target.set_cutoff_highpass_max
+                        setter = target.set_cutoff_highpass
+
+                    if np.ndim(value) == 0:
+                        setter(min(max(hi*value, lo), hi))
+                    else:
+                        setter(np.clip(hi*value, lo, hi))
+                set_cutoff.ramps = True
+                return (0.5, 0.5, 0, 1, set_cutoff)
+
+        if device == 'lfo1' or device == 'lfo2' or device == 'lfo3':
+            if control == 'speed':
+                return (
+                    target.speed_max/2, target.speed_max/2,
+                    target.speed_min, target.speed_max,
+                    target.set_speed
+                )
+
+            if control == 'amount':
+                return (
+                    0.5, 0.5,
+                    target.amount_min, target.amount_max,
+                    self._attr_setter(target, 'amount')
+                )
+
+            if control == 'offset':
+                return (
+                    0, 1,
+                    target.offset_min, target.offset_max,
+                    self._attr_setter(target, 'offset')
+                )
+
+        return None
+
+
+    def _attr_setter(self, target, name):
+        '''
+            Gives a function setting one attribute of target.
+        '''
+        def setter(value):
+            target.__dict__[name] = value
+        return setter
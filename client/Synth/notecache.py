@@ -0,0 +1,132 @@
+import collections
+import threading
+
+
+class notecache:
+    ''' A cache of rendered notes. A voice's output before the filters
+        only depends on its note, the length of the note and the settings
+        of the oscillators and envelopes, so a note that is played again
+        with the same settings is copied from the cache instead of being
+        rendered. Keys are built by voicebank.note_key.
+
+        Notes are kept in least recently used order. When the total size
+        of the cached notes goes over the memory budget the least recently
+        used ones are dropped.
+
+        Args:
+            budget=32*1024*1024: (int) memory budget in bytes
+
+        Returns:
+            None
+    '''
+
+    def __init__(self, budget=32*1024*1024):
+        self.budget = budget
+        self.notes = collections.OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+
+    def get(self, key):
+        '''
+            Gives the cached render of a note.
+
+            Args:
+                key: the key of the note
+
+            Returns:
+                a read-only ndarray of the samples of the note, or None
+                if it is not cached
+        '''
+        with self.lock:
+            samples = self.notes.get(key)
+            if samples is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            self.notes.move_to_end(key)
+            return samples
+
+
+    def put(self, key, samples):
+        '''
+            Caches the render of a note. The array is made read-only and
+            must not be changed afterwards.
+
+            Args:
+                key: the key of the note
+                samples: (ndarray) the samples of the whole note
+
+            Returns:
+                None
+        '''
+        if samples.nbytes > self.budget:
+            return
+
+        samples.flags.writeable = False
+
+        with self.lock:
+            old = self.notes.pop(key, None)
+            if not old is None:
+                self.size -= old.nbytes
+
+            self.notes[key] = samples
+            self.size += samples.nbytes
+            self._evict()
+
+
+    def set_budget(self, budget):
+        '''
+            Changes the memory budget, evicting notes if needed.
+
+            Args:
+                budget: (int) memory budget in bytes
+
+            Returns:
+                None
+        '''
+        with self.lock:
+            self.budget = budget
+            self._evict()
+
+
+    def clear(self):
+        '''
+            Drops every cached note. Counters are kept.
+        '''
+        with self.lock:
+            self.notes.clear()
+            self.size = 0
+
+
+    def stats(self):
+        '''
+            Gives the cache counters.
+
+            Returns:
+                (dict) with hits, misses, evictions, notes, size and budget
+        '''
+        with self.lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'notes': len(self.notes),
+                'size': self.size,
+                'budget': self.budget,
+            }
+
+
+    def _evict(self):
+        '''
+            Drops least recently used notes until the cache fits the
+            budget.
+        '''
+        while self.size > self.budget and self.notes:
+            key, samples = self.notes.popitem(last=False)
+            self.size -= samples.nbytes
+            self.evictions += 1
@@ -1,4 +1,6 @@
 import math
+import numpy as np
+import Synth.tuning
 import Synth.wavetables
 
 class wtOsc:
@@ -8,7 +10,11 @@ class wtOsc:
         not implemented yet
 
         Using the genOutput function you can generate one sample at the current
-        phase, looping it will produce a sound data stream.
+        phase, looping it will produce a sound data stream. genBlock generates
+        a whole block of samples at once.
+
+        Samples are read from the band-limited mip level of the wavetable
+        that fits the frequency, so high notes do not alias.
 
             Args:
                 phasor=0: (float) allows the ability to set the phasor value
@@ -25,16 +31,22 @@ class wtOsc:
 
                 volume=1: (float) 0 to 1, The amplitude scaling factor
 
+                tuning=None: (tuning) the tuning notes are looked up in,
+                    defaults to Synth.tuning.standard
+
             Returns:
                 None
     '''
 
     def __init__(self, pOffset=0, wav=None, samplerate=44100, detune=0,
-                 wavetablepos=0, volume=1):
-        self.wavetable = Synth.wavetables.wavetable()
+                 wavetablepos=0, volume=1, tuning=None):
+        if tuning == None:
+            tuning = Synth.tuning.standard
+        self.tuning = tuning
+        self.wavetable = None
         self.wavetsize = 2048
-        self.set_wavetable(wav)
         self.samplerate = samplerate
+        self.set_wavetable(wav)
         self.note = None
         self.freq = 0
         self.pOffset = pOffset
@@ -68,14 +80,47 @@ class wtOsc:
         if wav == None:
             return
 
-        self.wave_tables = self.wavetable.parse_wavtab(wav=wav)
-        self.wave_tables_num = len(self.wave_tables)/self.wavetsize
+        # Tables are shared through the registry and are read-only.
+        # wave_tables is (frames, wavetsize), wave_samples the same
+        # samples flat so the phasor can index it directly, and
+        # wave_mips the band-limited levels of wave_samples
+        self.wavetable = Synth.wavetables.tables.get(wav)
+        self.wave_tables = self.wavetable.table
+        self.wave_samples = self.wave_tables.reshape(-1)
+        self.wave_mips = self.wavetable.mips
+        self.wave_tables_num = len(self.wave_tables)
+        self.wavetablepos_max = self.wave_tables_num - 1
+
+        # Frequency the mip level was last picked for
+        self._mip_freq = None
+        self._mip_samples = self.wave_samples
+
+
+    def mip_level(self, freq):
+        '''
+            Gives the mip level for a frequency, the first level whose
+            highest harmonic is under half the samplerate.
+
+                Args:
+                    freq: (float or ndarray) frequency in Hz
+
+                Returns:
+                    (int or ndarray) the level
+        '''
+        top = len(self.wave_mips) - 1
+        harmonics = self.wavetable.harmonics * np.abs(freq) * 2 / self.samplerate
+        level = np.ceil(np.log2(np.maximum(harmonics, 1)))
+        level = np.minimum(level, top).astype(np.intp)
+
+        if level.ndim == 0:
+            return int(level)
+        return level
 
 
     def gen_freq(self, note=None):
         '''
             This function takes the note and detune from an wtosc object and
-            gives the frequency
+            gives the frequency, looked up in the oscillator's tuning
 
                 Args:
                     note: (list) containing two elements the string for the
@@ -83,48 +128,13 @@ class wtOsc:
                                 Ex. ['A', 4] = A from the fourth octave
                                 Ex. ['FS', 5] = F sharp from the fifth octave
 
-                    osc: (wtosc) Uses to grab the proper detune.
-
                 Returns:
                     (float) corresponding to the frequency
         '''
         if not note == None:
             self.note = note
 
-        tunefreq = 440
-        a = 1.059463094359 # 2^(1/12)
-        notes = {
-            "C":-9,
-            "B":2,
-            "D":-7,
-            "E":-5,
-            "F":-4,
-            "G":-2,
-            "A":0,
-            "CS":-8,
-            "DS":-6,
-            "FS":-3,
-            "GS":-1,
-            "AS":1
-        }
-
-
-        def _getfreq_(semitonediff):
-            freq = tunefreq * (pow(a, semitonediff))
-            return freq
-
-        def _getsemitonediff_f0_(note, octave):
-            semitonediff = (octave-5)*12
-            semitonediff = semitonediff + notes[note]
-            return semitonediff
-
-
-        semitonedif = _getsemitonediff_f0_(
-            self.note[0], self.note[1]
-        ) + self.detune
-        freq = _getfreq_(semitonedif)
-
-        return freq
+        return self.tuning.freq(self.note, self.detune)
 
 
     def genOutput(self):
@@ -150,14 +160,105 @@ class wtOsc:
         self.phasor = self.phasor + self.pInc
         # Checks that adding the offset does not place the phase
         # out of the window
-        if self.phasor >= (self.wavetablepos + 2048):
-            self.phasor = self.phasor - self.wavetsize + 1
+        if not (self.wavetablepos <= self.phasor
+                < self.wavetablepos + self.wavetsize):
+            self.phasor = self.wavetablepos + (
+                (self.phasor - self.wavetablepos) % self.wavetsize
+            )
 
-        output = (self.wave_tables[math.floor(self.phasor)])
+        if not self.freq == self._mip_freq:
+            self._mip_freq = self.freq
+            self._mip_samples = self.wave_mips[self.mip_level(self.freq)]
 
-        if output > 32768:
-            output = (65536 - output)*self.volume
-        else:
-            output = output*self.volume
+        output = self._mip_samples[math.floor(self.phasor)]*self.volume
 
         return output
+
+
+    def genBlock(self, n, freq=None):
+        '''
+            This function generates a block of audio samples. The phase
+            ramp for the block is built with a cumulative sum of the phase
+            increments and wrapped inside the current wavetable frame, then
+            all samples are looked up in the wavetable at once.
+
+                Args:
+                    n: (int) the number of samples to generate
+
+                    freq=None: (float or ndarray) the output frequency of the
+                        stream, either one value or one value per sample.
+                        Defaults to self.freq
+
+                Returns:
+                    (ndarray) of n floats corresponding to audio samples
+        '''
+        if self.enable == False or n == 0:
+            return np.zeros(n)
+
+        if freq is None:
+            freq = self.freq
+
+        pInc = np.empty(n + 1)
+        pInc[0] = self.phasor - self.wavetablepos
+        pInc[1:] = self.wavetsize * (np.asarray(freq) / self.samplerate)
+
+        phase = np.cumsum(pInc)[1:]
+        np.mod(phase, self.wavetsize, out=phase)
+
+        self.pInc = pInc[-1]
+        self.phasor = self.wavetablepos + phase[-1]
+
+        # float rounding in mod can land exactly on the frame size
+        index = phase.astype(np.intp)
+        np.minimum(index, self.wavetsize - 1, out=index)
+        index += int(self.wavetablepos)
+
+        # The highest frequency of the block picks the level
+        level = self.mip_level(np.max(np.abs(freq)))
+
+        return self.wave_mips[level][index] * self.volume
+
+
+    def genBank(self, phases, freqs, n):
+        '''
+            This function generates a block of audio samples for several
+            voices at once, each with its own phase and frequency. It works
+            like genBlock on a 2D phase ramp, one row per voice, but the
+            phases are passed in and returned instead of using self.phasor.
+
+                Args:
+                    phases: (ndarray) phase of each voice inside the frame,
+                        0 to wavetsize
+
+                    freqs: (ndarray) frequency of each voice
+
+                    n: (int) the number of samples to generate
+
+                Returns:
+                    (samples, phases):
+                        samples (ndarray) voices x n floats
+                        phases (ndarray) phase of each voice after the block
+        '''
+        phases = np.asarray(phases, dtype=float)
+        if self.enable == False or n == 0:
+            return np.zeros((len(phases), n)), phases
+
+        pInc = np.empty((len(phases), n + 1))
+        pInc[:, 0] = phases
+        pInc[:, 1:] = (
+            self.wavetsize * (np.asarray(freqs, dtype=float) / self.samplerate)
+        )[:, None]
+
+        phase = np.cumsum(pInc, axis=1)[:, 1:]
+        np.mod(phase, self.wavetsize, out=phase)
+
+        # float rounding in mod can land exactly on the frame size
+        index = phase.astype(np.intp)
+        np.minimum(index, self.wavetsize - 1, out=index)
+        index += int(self.wavetablepos)
+
+        levels = self.mip_level(np.asarray(freqs, dtype=float))
+
+        return (self.wave_mips[levels[:, None], index] * self.volume,
+                phase[:, -1].copy())
+
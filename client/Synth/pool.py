@@ -0,0 +1,269 @@
+import math
+import multiprocessing
+import os
+from multiprocessing import shared_memory
+import numpy as np
+import Synth.voice
+
+# State of a worker process, set up by _init
+_worker = {}
+
+
+def plan(synth, sequence):
+    '''
+        Works out where every note of a sequence sounds without rendering
+        it. Voices are handed out by synth.bank's allocator, reset first
+        as in the block engine, so its stats count the sequence. A note
+        that has ended frees its voice before the next entry starts.
+
+            Args:
+                synth: (synth) the synth
+                sequence: (list) a sequence in the format taken by play
+
+            Returns:
+                (notes, total):
+                    notes (list) of (voice, start, length, note, time), a
+                        note sounding on voice for length samples from
+                        sample start
+                    total (int) the number of samples in the sequence
+    '''
+    bank = synth.bank
+    bank.reset()
+    alloc = bank.alloc
+    playing = dict()
+    notes = []
+    pos = 0
+
+    def level(i):
+        start, life, note, time = playing[i]
+        notesamp = synth.samplerate * time
+        return float(
+            bank.env1.render(notesamp, pos - start, 1)[0]
+            + bank.env2.render(notesamp, pos - start, 1)[0]
+        )
+
+    def stop(i):
+        start, life, note, time = playing.pop(i)
+        length = min(life, pos - start)
+        if length > 0:
+            notes.append((i, start, length, note, time))
+
+    def release():
+        for i in [i for i in playing if sum(playing[i][:2]) <= pos]:
+            stop(i)
+            alloc.release(i)
+
+    for entry in sequence:
+        time = entry[1]
+
+        release()
+
+        for note in synth._chord(entry[0]):
+            i = alloc.allocate(note, level)
+            if i == None:
+                continue
+            if i in playing:
+                # Stolen or retriggered
+                stop(i)
+            life = math.floor(synth.samplerate * time) + 1
+            playing[i] = (pos, life, note, time)
+
+        pos += math.ceil(time * synth.samplerate)
+
+    release()
+    for i in list(playing):
+        stop(i)
+
+    return notes, pos
+
+
+def render(synth, sequence, workers=None, out=None):
+    '''
+        Renders a sequence with the voices spread over a pool of worker
+        processes. Before the filters every note is independent of the
+        others, so the notes given by plan are rendered by the workers
+        and added straight into a shared memory buffer with one row per
+        worker. This process then sums the rows and runs the mix through
+        the filters block by block. Notes in synth.notecache are added
+        from it instead of rendered, and notes that are rendered to their
+        end are sent back by the workers and added to it.
+
+        LFO modulation changes the oscillators and envelopes over time,
+        so while an LFO is routed the sequence is rendered by the block
+        engine instead.
+
+            Args:
+                synth: (synth) the synth
+                sequence: (list) a sequence in the format taken by play
+
+                workers=None: (int) the number of worker processes,
+                    defaults to the number of CPUs. With 1 the notes are
+                    rendered in this process
+
+                out=None: (ndarray) optional preallocated float or int16
+                    array of at least seq_samples(sequence) samples, by
+                    default int16 if synth.compact is set and float if
+                    not. With compact the rows are float32.
+
+            Returns:
+                (ndarray) the output samples
+    '''
+    if workers == None:
+        workers = os.cpu_count() or 1
+    signal, output = synth._dtypes()
+
+    if synth.matrix.active():
+        print('LFO routed, rendering with the block engine.')
+        total = synth.seq_samples(sequence)
+        if out is None:
+            out = np.empty(total, dtype=output)
+        for block in synth.render(sequence, out=out[:total]):
+            pass
+        return out
+
+    notes, total = plan(synth, sequence)
+    if out is None:
+        out = np.empty(total, dtype=output)
+
+    print('Rendering {} notes on {} workers.'.format(len(notes), workers))
+
+    # Notes in the cache are added here, and notes repeated in the
+    # sequence are rendered once and added afterwards. A job carries the
+    # index in keys of a note that plays to its end, so the worker sends
+    # the note back, and None otherwise.
+    cache = synth.notecache
+    synth.bank.dtype = signal
+    cached = []
+    jobs = []
+    keys = []
+    first = dict()
+    repeats = []
+    for voice, start, length, note, time in notes:
+        key = synth.bank.note_key(note, time)
+        samples = cache.get(key)
+        if not samples is None:
+            cached.append((start, samples[:length]))
+        elif key in first:
+            repeats.append((start, length, first[key]))
+        elif length == math.floor(synth.samplerate * time) + 1:
+            first[key] = len(keys)
+            jobs.append((start, length, note, time, len(keys)))
+            keys.append(key)
+        else:
+            jobs.append((start, length, note, time, None))
+
+    # Row 0 is this process's, the others one per worker
+    pooled = workers > 1 and len(jobs) > 1
+    blocksize = synth.blocksize
+    shape = (1 + workers if pooled else 1, total)
+    shm = shared_memory.SharedMemory(
+        create=True,
+        size=max(1, shape[0] * shape[1] * np.dtype(signal).itemsize)
+    )
+
+    try:
+        rows = np.ndarray(shape, dtype=signal, buffer=shm.buf)
+        rows[:] = 0
+
+        for start, samples in cached:
+            rows[0, start:start + len(samples)] += samples
+
+        # A one voice bank renders each note
+        bank = Synth.voice.voicebank(
+            synth.oscil, synth.oscil2, synth.env1, synth.env2,
+            voices=1, samplerate=synth.samplerate, dtype=signal
+        )
+        timer = synth._timer
+        timer.mark()
+
+        rendered = []
+        if pooled:
+            # Each worker takes the next row as it starts
+            args = (bank, shm.name, shape, blocksize,
+                    multiprocessing.Value('i', 1))
+            chunk = max(1, len(jobs) // (workers * 4))
+            with multiprocessing.Pool(workers, _init, args) as pool:
+                for i in pool.imap_unordered(_render_note, jobs, chunk):
+                    rendered.append(i)
+        else:
+            _worker.update(bank=bank, row=rows[0], blocksize=blocksize)
+            try:
+                for i in jobs:
+                    rendered.append(_render_note(i))
+            finally:
+                _worker.clear()
+        timer.lap('voices')
+
+        # Cache the notes that played to their end
+        kept = dict(i for i in rendered if not i is None)
+        for index, samples in kept.items():
+            cache.put(keys[index], samples)
+
+        for start, length, index in repeats:
+            rows[0, start:start + length] += kept[index][:length]
+
+        # An int16 output is filled through a scratch block
+        block = None
+        if out.dtype.kind == 'i':
+            block = np.empty(blocksize, dtype=signal)
+
+        for pos in range(0, total, blocksize):
+            mix = rows[:, pos:pos + blocksize].sum(axis=0)
+            if block is None:
+                synth._master(mix, out[pos:pos + len(mix)])
+            else:
+                synth._master(mix, block[:len(mix)])
+                out[pos:pos + len(mix)] = block[:len(mix)]
+
+        del rows
+    finally:
+        shm.close()
+        shm.unlink()
+
+    return out
+
+
+def _init(bank, name, shape, blocksize, counter):
+    '''
+        Sets up a worker process: attaches the shared buffer and takes
+        the next row of it from counter.
+    '''
+    with counter.get_lock():
+        row = counter.value
+        counter.value += 1
+
+    shm = shared_memory.SharedMemory(name=name)
+    _worker.update(
+        bank=bank,
+        shm=shm,
+        row=np.ndarray(shape, dtype=bank.dtype, buffer=shm.buf)[row],
+        blocksize=blocksize
+    )
+
+
+def _render_note(job):
+    '''
+        Renders one note and adds it into the worker's row of the shared
+        buffer, in blocks of blocksize samples as the block engine does.
+
+            Returns:
+                (index, samples) the note, if the job has an index, or
+                None
+    '''
+    start, length, note, time, index = job
+    bank = _worker['bank']
+    row = _worker['row']
+    blocksize = _worker['blocksize']
+
+    bank.load_note(0, note, time)
+    if not index is None:
+        samples = np.empty(length, dtype=bank.dtype)
+    for pos in range(start, start + length, blocksize):
+        n = min(blocksize, start + length - pos)
+        block = bank.genBlock(n)
+        row[pos:pos + n] += block
+        if not index is None:
+            samples[pos - start:pos - start + n] = block
+
+    if not index is None:
+        return index, samples
@@ -0,0 +1,133 @@
+import json
+import os
+
+''' Preset keys passed to the synth constructor '''
+SYNTH_ARGS = ('volume', 'engine', 'blocksize', 'voices', 'steal', 'workers',
+              'periodsize', 'periods', 'compact')
+
+
+def load(path):
+    '''
+        Reads a preset from a JSON file. Wavetable and Scala paths in the
+        preset are taken relative to the file.
+
+            Args:
+                path: location of the preset file
+
+            Returns:
+                (dict) the preset
+    '''
+    with open(path) as f:
+        preset = json.load(f)
+
+    base = os.path.dirname(os.path.abspath(path))
+    for name in ('oscil', 'oscil2'):
+        if 'wav' in preset.get(name, {}):
+            preset[name]['wav'] = os.path.join(base, preset[name]['wav'])
+    if 'scala' in preset:
+        preset['scala'] = os.path.join(base, preset['scala'])
+
+    return preset
+
+
+def synth_args(preset):
+    '''
+        Gives the arguments of the synth constructor set by a preset.
+
+            Args:
+                preset: (dict) the preset
+
+            Returns:
+                (dict) keyword arguments for Synth.synth
+    '''
+    return {i: preset[i] for i in SYNTH_ARGS if i in preset}
+
+
+def apply(synth, preset):
+    '''
+        Sets the controls of a synth from a preset. A preset is a dict
+        with any of the synth arguments (see SYNTH_ARGS), the tuning and
+        one dict per device:
+
+            {
+                "volume": 0.75,
+                "reference": 440,
+                "scala": "path to .scl file",
+                "oscil": {"wav": "path to .wav", "detune": 0,
+                          "wavetablepos": 0, "volume": 0.75,
+                          "pOffset": 0, "enable": true},
+                "env1": {"attack": 0.1, "decay": 2, "sustain": 0.5,
+                         "release": 2, "enable": true},
+                "fil1": {"lowpass": 2000, "enable": true},
+                "fil2": {"highpass": 100},
+                "lfo1": {"device": "oscil", "control": "volume",
+                         "speed": 5, "amount": 0.5, "offset": 0,
+                         "wavetype": "sin", "retrig": false,
+                         "enable": true}
+            }
+
+        The oscillators are oscil and oscil2, the envelopes env1 and env2,
+        the filters fil1 and fil2 and the LFOs lfo1, lfo2 and lfo3.
+
+            Args:
+                synth: (synth) the synth
+                preset: (dict) the preset
+
+            Returns:
+                None
+    '''
+    if 'volume' in preset:
+        synth.volume = preset['volume']
+    if 'scala' in preset:
+        synth.tuning.load_scala(preset['scala'])
+    if 'reference' in preset:
+        synth.tuning.set_reference(preset['reference'])
+
+    for name in ('oscil', 'oscil2'):
+        controls = dict(preset.get(name, {}))
+        osc = synth.__dict__[name]
+        if 'wav' in controls:
+            osc.set_wavetable(wav=controls.pop('wav'))
+        if 'wavetablepos' in controls:
+            osc.wavetablepos = controls.pop('wavetablepos') * osc.wavetsize
+        _set(osc, name, controls, ('detune', 'volume', 'pOffset', 'enable'))
+
+    for name in ('env1', 'env2'):
+        controls = dict(preset.get(name, {}))
+        env = synth.__dict__[name]
+        for control in ('attack', 'decay', 'sustain', 'release'):
+            if control in controls:
+                getattr(env, 'set_' + control)(controls.pop(control))
+        _set(env, name, controls, ('enable',))
+
+    for name in ('fil1', 'fil2'):
+        controls = dict(preset.get(name, {}))
+        fil = synth.__dict__[name]
+        if 'lowpass' in controls:
+            fil.set_cutoff_lowpass(controls.pop('lowpass'))
+        if 'highpass' in controls:
+            fil.set_cutoff_highpass(controls.pop('highpass'))
+        _set(fil, name, controls, ('enable',))
+
+    for name in ('lfo1', 'lfo2', 'lfo3'):
+        controls = dict(preset.get(name, {}))
+        lfo = synth.__dict__[name]
+        if 'device' in controls or 'control' in controls:
+            lfo.set_device_control(
+                controls.pop('device', lfo.device),
+                controls.pop('control', lfo.control)
+            )
+        if 'speed' in controls:
+            lfo.set_speed(controls.pop('speed'))
+        _set(lfo, name, controls,
+             ('amount', 'offset', 'wavetype', 'retrig', 'enable'))
+
+
+def _set(device, name, controls, allowed):
+    '''
+        Sets plain attributes of a device, refusing unknown controls.
+    '''
+    for control, value in controls.items():
+        if not control in allowed:
+            raise ValueError('unknown control {} of {}'.format(control, name))
+        device.__dict__[control] = value
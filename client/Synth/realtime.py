@@ -0,0 +1,213 @@
+import queue
+import threading
+import time
+import numpy as np
+
+
+class fakepcm:
+    ''' A stand-in for an ALSA PCM device, for running the real-time
+        engine without a sound card. It takes int16 periods and plays them
+        back in real time: write blocks while the device buffer (periods
+        periods of setperiodsize samples) is full, and if the device runs
+        out of samples it counts an xrun.
+
+        Args:
+            samplerate=44100: (int) the sample rate
+
+            periods=4: (int) the number of periods the device buffer holds
+
+            keep=False: (bool) keep the written periods in data
+
+        Returns:
+            None
+    '''
+
+    def __init__(self, samplerate=44100, periods=4, keep=False):
+        self.samplerate = samplerate
+        self.periods = periods
+        self.periodsize = 256
+        self.keep = keep
+        self.data = []
+        self.written = 0
+        self.xruns = 0
+
+        # Time playback started at and the samples played before that
+        self._start = None
+        self._base = 0
+
+
+    def setperiodsize(self, size):
+        self.periodsize = size
+        return size
+
+
+    def write(self, data):
+        '''
+            Queues samples to be played, waiting for room in the buffer.
+
+            Args:
+                data: (ndarray) int16 samples
+
+            Returns:
+                (int) the number of samples written
+        '''
+        now = time.perf_counter()
+        if self._start == None or self._played(now) > self.written:
+            if not self._start == None:
+                self.xruns += 1
+            self._start = now
+            self._base = self.written
+
+        self.written += len(data)
+        if self.keep:
+            self.data.append(np.array(data, dtype=np.int16))
+
+        wait = self.written - self.periods * self.periodsize - self._played(now)
+        if wait > 0:
+            time.sleep(wait / self.samplerate)
+
+        return len(data)
+
+
+    def _played(self, now):
+        '''
+            Gives the number of samples played by now.
+        '''
+        return self._base + (now - self._start) * self.samplerate
+
+
+def run(synth, sequence, pcm, periodsize, periods, cancel=None,
+        progress=None):
+    '''
+        Plays a sequence in real time. A render thread renders periods of
+        periodsize samples into a ring of up to periods periods, ahead of
+        the device. This thread writes them to the device once the ring is
+        full, and writes a period of silence (an underrun) whenever the
+        ring stays empty for a period's time while the device plays. pcm.write must block
+        while the device buffer is full, as with ALSA or fakepcm.
+
+        Args:
+            synth: (synth) the synth
+            sequence: (list) a sequence in the format taken by play
+            pcm: the device, with a write method taking int16 samples
+            periodsize: (int) samples per period
+            periods: (int) periods in the ring
+            cancel=None: (threading.Event) set to stop at the next period
+            progress=None: (function) called as progress(done, total)
+
+        Returns:
+            (dict) with
+                periods: number of periods written
+                underruns: number of silent periods written because the
+                    ring was empty
+                xruns: the device's count of xruns, if it keeps one
+                period_time: seconds of audio in a period
+                latency: seconds of audio in the ring
+                render_mean, render_max: seconds taken to render a period
+                headroom: period_time - render_max, negative if a period
+                    took longer to render than to play
+                late: number of periods that took longer to render than
+                    to play
+                total: seconds the whole call took
+    '''
+    start = time.perf_counter()
+    period_time = periodsize / synth.samplerate
+    ring = queue.Queue(maxsize=periods)
+    primed = threading.Event()
+    stop = threading.Event()
+    times = {'count': 0, 'sum': 0.0, 'max': 0.0, 'late': 0}
+    timer = synth._timer
+
+    blocks = synth._watch(
+        synth.render(sequence, blocksize=periodsize), 0,
+        synth.seq_samples(sequence), cancel, progress
+    )
+
+    wav = None
+    if synth.record == True:
+        wav = synth.open_record()
+        blocks = synth._tee(blocks, wav)
+
+    def _render():
+        try:
+            blocks_iter = iter(blocks)
+            while not stop.is_set():
+                begin = time.perf_counter()
+                block = next(blocks_iter, None)
+                if block is None:
+                    break
+                timer.mark()
+                data = block.astype(np.int16)
+                timer.lap('conversion')
+
+                took = time.perf_counter() - begin
+                times['count'] += 1
+                times['sum'] += took
+                times['max'] = max(times['max'], took)
+                if took > period_time:
+                    times['late'] += 1
+
+                ring.put(data)
+                if ring.full():
+                    primed.set()
+        except Exception as e:
+            ring.put(e)
+        finally:
+            ring.put(None)
+            primed.set()
+
+    try:
+        pcm.setperiodsize(periodsize)
+    except AttributeError:
+        pass
+
+    renderer = threading.Thread(target=_render, daemon=True)
+    renderer.start()
+
+    stats = {'periods': 0, 'underruns': 0}
+    silence = np.zeros(periodsize, dtype=np.int16)
+
+    try:
+        primed.wait()
+        while True:
+            # The device still holds at least the last period, so the
+            # ring has that long to catch up before it is an underrun
+            try:
+                data = ring.get(timeout=period_time)
+            except queue.Empty:
+                stats['underruns'] += 1
+                pcm.write(silence)
+                continue
+
+            if data is None:
+                break
+            if isinstance(data, Exception):
+                raise data
+
+            begin = time.perf_counter()
+            pcm.write(data)
+            timer.add('alsa write', time.perf_counter() - begin)
+            stats['periods'] += 1
+    finally:
+        # Unblock the render thread if this one stopped early
+        stop.set()
+        while renderer.is_alive():
+            try:
+                ring.get(timeout=period_time)
+            except queue.Empty:
+                pass
+        if not wav == None:
+            wav.close()
+
+    count = max(times['count'], 1)
+    stats.update({
+        'xruns': getattr(pcm, 'xruns', None),
+        'period_time': period_time,
+        'latency': periods * period_time,
+        'render_mean': times['sum'] / count,
+        'render_max': times['max'],
+        'headroom': period_time - times['max'],
+        'late': times['late'],
+        'total': time.perf_counter() - start,
+    })
+    return stats
@@ -0,0 +1,145 @@
+import threading
+import time
+
+''' Stages of a render, in the order they run '''
+STAGES = ('lfo', 'voices', 'mix', 'fil1', 'fil2', 'conversion', 'wav write',
+          'alsa write')
+
+
+class stagetimer:
+    '''
+        This class adds up the wall time a render spends in each stage.
+
+        The rendering thread calls mark before a stage and lap after it,
+        which adds the time since the last mark or lap to the stage.
+        Other threads (device writers) time themselves and call add, so
+        with the streaming engines the stages overlap and can add up to
+        more than the wall time.
+
+            Args:
+                samplerate=44100: (int) the sample rate, for the real-time
+                    factor
+
+            Returns:
+                None
+    '''
+
+    def __init__(self, samplerate=44100):
+        self.samplerate = samplerate
+        self.times = {}
+        self.samples = 0
+        self.lock = threading.Lock()
+        self.start = time.perf_counter()
+        self.last = self.start
+
+
+    def mark(self):
+        '''
+            Starts timing a stage.
+        '''
+        self.last = time.perf_counter()
+
+
+    def lap(self, stage):
+        '''
+            Adds the time since the last mark or lap to a stage and starts
+            timing the next one.
+        '''
+        now = time.perf_counter()
+        self.add(stage, now - self.last)
+        self.last = now
+
+
+    def add(self, stage, seconds):
+        '''
+            Adds time to a stage.
+        '''
+        with self.lock:
+            self.times[stage] = self.times.get(stage, 0) + seconds
+
+
+    def rendered(self, n):
+        '''
+            Counts rendered samples.
+        '''
+        self.samples += n
+
+
+    def report(self):
+        '''
+            Gives the totals so far.
+
+                Returns:
+                    (dict) with
+                        samples: samples rendered
+                        audio: seconds of audio rendered
+                        wall: seconds since the timer was made
+                        realtime: audio / wall, above 1 is faster than
+                            real time
+                        stages: {stage: (seconds, percent of wall)}
+                        other: seconds not in any stage, 0 if the
+                            stages overlap
+        '''
+        wall = time.perf_counter() - self.start
+        audio = self.samples / self.samplerate
+        with self.lock:
+            times = dict(self.times)
+
+        order = [i for i in STAGES if i in times]
+        order += sorted(i for i in times if not i in STAGES)
+
+        return {
+            'samples': self.samples,
+            'audio': audio,
+            'wall': wall,
+            'realtime': audio / wall if wall > 0 else 0,
+            'stages': {
+                i: (times[i], 100 * times[i] / wall if wall > 0 else 0)
+                for i in order
+            },
+            'other': max(wall - sum(times.values()), 0),
+        }
+
+
+class nulltimer:
+    '''
+        A stage timer that does nothing, used while instrumentation is
+        off.
+    '''
+
+    def mark(self):
+        pass
+
+    def lap(self, stage):
+        pass
+
+    def add(self, stage, seconds):
+        pass
+
+    def rendered(self, n):
+        pass
+
+
+# The timer used while instrumentation is off
+NULL = nulltimer()
+
+
+def format_report(report):
+    '''
+        Formats a report given by stagetimer.report as a table.
+
+            Args:
+                report: (dict) the report
+
+            Returns:
+                (str) the table
+    '''
+    lines = ['{} samples ({:.2f} s of audio) in {:.2f} s, {:.2f}x real time'
+             .format(report['samples'], report['audio'], report['wall'],
+                     report['realtime'])]
+    for stage, (seconds, percent) in report['stages'].items():
+        lines.append('  {:<12}{:>9.3f} s{:>7.1f}%'.format(
+            stage, seconds, percent
+        ))
+    lines.append('  {:<12}{:>9.3f} s'.format('other', report['other']))
+    return '\n'.join(lines)
@@ -1,19 +1,37 @@
+import copy
 import numpy as np
-import os
+import queue
 import Synth.LFO
+import Synth.modmatrix
+import Synth.notecache
 import Synth.osc
+import Synth.pool
+import Synth.realtime
+import Synth.stages
+import Synth.tuning
 import Synth.wavetables
 try:
     import alsaaudio
 except:
     print('Alsa Audio not found.')
 import math
+import threading
 import time
 import Synth.envelope
 import Synth.filt
 import Synth.voice
-import wave
+import Synth.wavwriter
 
+# Devices of the synth, as named in the synth
+DEVICES = (
+    'oscil', 'oscil2', 'env1', 'env2', 'fil1', 'fil2', 'lfo1', 'lfo2', 'lfo3'
+)
+
+# Values of the devices that change while rendering
+RENDER_STATE = {
+    'phase', 'phasor', 'pInc', 'freq', '_mip_freq', 'sustainsamples',
+    'past_input', 'past_output'
+}
 
 class synth:
     '''
@@ -43,6 +61,17 @@ class synth:
                     volume (amplitude):
                         synth_class_object.volume
 
+                    Tuning reference (Hz) for ['A', 5]:
+                        synth_class_object.tuning.set_reference(Hz)
+
+                    Load a Scala tuning:
+                        synth_class_object.tuning.\
+                            load_scala('path to .scl file')
+
+                    Record to a file ('int16', 'int24' or 'float32' wav):
+                        synth_class_object.record_path = 'path to file'
+                        synth_class_object.record_format = 'int24'
+
                 Oscillators (names: oscil and oscil2):
 
                     Detune (semitones):
@@ -115,38 +144,111 @@ class synth:
         the audio for the entire sequence and plays it back through the
         speaker.
 
+        Five render engines are available, selected with the engine
+        attribute:
+            'sample' renders one sample at a time through the whole chain.
+            'block' renders fixed-size blocks of samples (blocksize) through
+                the same chain into a single preallocated numpy array.
+            'stream' renders blocks of blocksize samples as int16 periods
+                and plays each one while the next one renders.
+            'pool' renders the notes on a pool of worker processes and
+                runs the mix through the filters in this process (see
+                Synth.pool.render).
+            'realtime' plays periods of periodsize samples rendered by a
+                render thread into a ring of periods periods ahead of the
+                device (see Synth.realtime.run).
+
+        With compact set, voices and blocks are kept in float32 and the
+        whole output in int16 instead of float64 (Python floats with the
+        sample engine), which takes a fraction of the memory. The output
+        can differ from the default by one step of the int16 output now
+        and then.
+
             Args:
                 volume=0.75 (float) scaling factor for final audio
                     stream amplitude
 
+                engine='sample' (str) render engine used by play, one of
+                    'sample', 'block', 'stream', 'pool' or 'realtime'
+
+                blocksize=1024 (int) number of samples per block for the
+                    block engine, 256 to 4096 is a sensible range
+
+                voices=8 (int) number of voices
+
+                steal='oldest' (str) what the block engines do with a new
+                    note when every voice is busy: 'oldest', 'quietest',
+                    'retrigger' or 'none' (see Synth.voice.allocator)
+
+                workers=None (int) number of worker processes of the pool
+                    engine, defaults to the number of CPUs
+
+                periodsize=256 (int) samples per period of the realtime
+                    engine
+
+                periods=4 (int) number of periods the realtime engine
+                    renders ahead of the device
+
+                compact=False (bool) render in float32 into int16 output
+
+                audio=True (bool) open the ALSA device and unmute the
+                    mixer. With False nothing is played, the synth only
+                    records, as for rendering to files without a sound
+                    device
+
             Returns:
                 None
     '''
 
-    def __init__(self, volume=0.75):
+    def __init__(self, volume=0.75, engine='sample', blocksize=1024,
+                 voices=8, steal='oldest', workers=None, periodsize=256,
+                 periods=4, compact=False, audio=True):
         self.samplerate = 44100
+        self.engine = engine
+        self.blocksize = blocksize
+        self.workers = workers
+        self.periodsize = periodsize
+        self.periods = periods
+        self.compact = compact
         self.ard_ex = False
         self.volume = volume
         self.feed = list()
         self.record = False
+        self.record_path = 'output.wav'
+        self.record_format = 'int16'
         self.playback = False
         self.playb_dis = False
+        self.stream_stats = None
+        self.realtime_stats = None
+        self._last_render = None
 
-        # Open audio channel
-        try:
-            self.aud = alsaaudio.PCM()
-            self.aud.setchannels(1)
-            self.aud.setrate(self.samplerate)
-            self.aud.setformat(alsaaudio.PCM_FORMAT_S16_LE)
-            self.mixer = alsaaudio.Mixer()
-            self.mixer.setmute(0,0)
+        # Per-stage timing of renders, off unless instrument is set
+        self.instrument = False
+        self.render_report = None
+        self._timer = Synth.stages.NULL
 
-        except:
-            print('Could not open audio channel.')
-            print('Defaulting to record.')
+        # Open audio channel
+        if audio:
+            try:
+                self.aud = alsaaudio.PCM()
+                self.aud.setchannels(1)
+                self.aud.setrate(self.samplerate)
+                self.aud.setformat(alsaaudio.PCM_FORMAT_S16_LE)
+                self.mixer = alsaaudio.Mixer()
+                self.mixer.setmute(0,0)
+
+            except:
+                print('Could not open audio channel.')
+                print('Defaulting to record.')
+                self.record = True
+                self.playb_dis = True
+        else:
             self.record = True
             self.playb_dis = True
 
+        # Note frequency table shared by both oscs
+        self.tuning = Synth.tuning.tuning()
+
         # Load oscs
         self.oscil = Synth.osc.wtOsc(
             wav='./Synth/wavetables/basic.wav',
@@ -154,14 +256,16 @@ class synth:
             pOffset=1024,
             detune=0,
             wavetablepos=0,
-            samplerate=self.samplerate
+            samplerate=self.samplerate,
+            tuning=self.tuning
         )
         self.oscil2 = Synth.osc.wtOsc(
             wav='./Synth/wavetables/basic.wav',
             volume=0.75,
             detune=0,
             wavetablepos=0,
-            samplerate=self.samplerate
+            samplerate=self.samplerate,
+            tuning=self.tuning
         )
 
         # Load Envelopes
@@ -170,7 +274,7 @@ class synth:
 
         # Load voices
         self.voices = []
-        for i in range(0,8):
+        for i in range(0,voices):
             x = Synth.voice.voice(
                 self.oscil,
                 self.oscil2,
@@ -179,6 +283,21 @@ class synth:
             )
             self.voices.append(x)
 
+        # Rendered notes reused by the block engines
+        self.notecache = Synth.notecache.notecache()
+
+        # Voice bank used by the block engines
+        self.bank = Synth.voice.voicebank(
+            self.oscil,
+            self.oscil2,
+            self.env1,
+            self.env2,
+            voices=voices,
+            steal=steal,
+            samplerate=self.samplerate,
+            cache=self.notecache
+        )
+
         # Load Filters
         self.fil1 = Synth.filt.filter()
         self.fil2 = Synth.filt.filter()
@@ -205,6 +324,9 @@ class synth:
             amount=0
         )
 
+        # Compiled LFO routes used by the block engine
+        self.matrix = Synth.modmatrix.modmatrix(self)
+
 
     def gen_freq(self, note, osc):
         '''
@@ -220,47 +342,23 @@ class synth:
                     osc: (wtosc) Uses to grab the proper detune.
 
                 Returns:
-                    (float) corresponding to the frequency
-        '''
-
-        tunefreq = 440
-        a = 1.059463094359 # 2^(1/12)
-        notes = {
-            "C":-9,
-            "B":2,
-            "D":-7,
-            "E":-5,
-            "F":-4,
-            "G":-2,
-            "A":0,
-            "CS":-8,
-            "DS":-6,
-            "FS":-3,
-            "GS":-1,
-            "AS":1
-        }
-
-
-        def _getfreq_(semitonediff):
-            freq = tunefreq * (pow(a, semitonediff))
-            return freq
-
-        def _getsemitonediff_f0_(note, octave):
-            semitonediff = (octave-5)*12
-            semitonediff = semitonediff + notes[note]
-            return semitonediff
-
+                    (float) corresponding to the frequency, looked up in
+                        self.tuning
+        '''
 
-        semitonedif = _getsemitonediff_f0_(note[0], note[1]) + osc.detune
-        freq = _getfreq_(semitonedif)
-        return freq
+        return self.tuning.freq(note, osc.detune)
 
 
 
-    def play(self, sequence):
+    def play(self, sequence, cancel=None, progress=None):
         '''
             This function takes a squence and generates and plays the audio
-            for that sequence.
+            for that sequence, using the engine selected by self.engine.
+
+            Rendering can be cancelled from another thread. The block,
+            stream and realtime engines stop at the next block, the sample engine at the
+            next note; nothing is output for a cancelled render. The pool
+            engine always renders to the end.
 
                 Args:
                     sequence (list): containing a note ( ['note',octave] ) and
@@ -269,28 +367,85 @@ class synth:
                                         Ex. [['A',4],4] = Play A 4 for
                                             4 seconds
 
+                    cancel=None (threading.Event): set to cancel rendering
+
+                    progress=None (function): called as progress(done,
+                        total) with the number of samples rendered so far
+                        and in total, after every block (every note with
+                        the sample engine)
+
                 Returns:
                     None
+
+            If self.instrument is set, the wall time spent in each stage
+            of the chain is added up and the totals are kept in
+            self.render_report (see Synth.stages.stagetimer.report). The
+            sample engine times each sample's stages, which slows it down
+            more than the block engines while timing is on.
+        '''
+        if not self.instrument:
+            self._play(sequence, cancel, progress)
+            return
+
+        self._timer = Synth.stages.stagetimer(self.samplerate)
+        try:
+            self._play(sequence, cancel, progress)
+        finally:
+            self.render_report = self._timer.report()
+            self._timer = Synth.stages.NULL
+
+
+    def _play(self, sequence, cancel=None, progress=None):
+        '''
+            Plays a sequence with the engine selected by self.engine.
+        '''
+        if self.engine == 'block':
+            self._play_block(sequence, cancel, progress)
+        elif self.engine == 'stream':
+            self._play_stream(sequence, cancel, progress)
+        elif self.engine == 'pool':
+            self._play_pool(sequence)
+        elif self.engine == 'realtime':
+            self._play_realtime(sequence, cancel, progress)
+        else:
+            self._play_sample(sequence, cancel, progress)
+
+
+    def _play_sample(self, sequence, cancel=None, progress=None):
+        '''
+            Per-sample engine: renders the sequence one sample at a time
+            and outputs it.
         '''
         totaltime = 0
         note_count = 1
         total_notes = len(sequence)
         totalsamples = 0
+        done = 0
         samples = []
+        if self.compact:
+            buf = np.empty(self.seq_samples(sequence), dtype=np.int16)
+            samples.append(buf)
+        timer = self._timer
+        # Checked per stage so nothing is timed per sample while off
+        timed = not timer is Synth.stages.NULL
         for i in self.voices:
             i.in_use = False
 
         for i in sequence:
+            if not cancel == None and cancel.is_set():
+                print('Render cancelled.')
+                return
             note = i[0]
             time = i[1]
             notesamp = []
 
 
+            numsamples = time * self.samplerate
+            totalsamples += numsamples
+
             for j in self.voices:
                 if j.in_use == False:
                     j.load_note(note, time)
-                    numsamples = time * self.samplerate
-                    totalsamples += numsamples
                     break
 
             self.lfo1.get_retrig()
@@ -307,6 +462,7 @@ class synth:
 
             note_count += 1
 
+            timer.mark()
             while count < numsamples:
                 # This is the order the synth will run
 
@@ -314,6 +470,8 @@ class synth:
                 self.lfo1.update_control(self.lfo1.device, self.lfo1.control)
                 self.lfo2.update_control(self.lfo2.device, self.lfo2.control)
                 self.lfo3.update_control(self.lfo3.device, self.lfo3.control)
+                if timed:
+                    timer.lap('lfo')
 
                 tot = 0
                 sig_count = 0
@@ -324,6 +482,8 @@ class synth:
                         if not (out == None or out[0] == 0):
                             tot += out[0]
                             sig_count += out[1]
+                if timed:
+                    timer.lap('voices')
 
                 tot = tot//2
                 # Limits the feed, if tot > 100% volume clip it to 100%
@@ -335,12 +495,18 @@ class synth:
                 output = tot
                 del self.mix_past[0]
                 self.mix_past.append(output)
+                if timed:
+                    timer.lap('mix')
 
                 # Feeds into the filter's
 
                 self.fil1_past.append(self.fil1.generate_output(self.mix_past))
                 del self.fil1_past[0]
+                if timed:
+                    timer.lap('fil1')
                 output = self.fil2.generate_output(self.fil1_past)
+                if timed:
+                    timer.lap('fil2')
 
                 # Limits the feed, if tot > 100% volume clip it to 100%
                 if output > 32767:
@@ -350,27 +516,40 @@ class synth:
 
                 notesamp.append(output*self.volume)
                 count += 1
+                if timed:
+                    timer.lap('mix')
 
-            samples.append(notesamp)
-        totalsamples = math.floor(totalsamples)
+            if self.compact:
+                # Only one note is held as Python floats at a time
+                buf[done:done + len(notesamp)] = notesamp
+            else:
+                samples.append(notesamp)
+            timer.rendered(len(notesamp))
 
+            if not progress == None:
+                progress(done + len(notesamp), self.seq_samples(sequence))
+            done += len(notesamp)
 
+        totalsamples = math.floor(totalsamples)
 
+        self._output(samples, totalsamples)
 
-        if self.record == True:
-            print('Recording to output.wav...')
-            if os.path.exists('output.wav'):
-                os.remove('output.wav')
 
-            with wave.open('output.wav', mode='wb') as wav:
-                wav.setnchannels(1)
-                wav.setsampwidth(2)
-                wav.setframerate(44100)
-                wav.setnframes(len(samples))
+    def _output(self, samples, totalsamples):
+        '''
+            Records and/or plays back rendered audio.
 
-                for i in samples:
-                    wav.writeframes(np.int16(i))
+                Args:
+                    samples (list): of sample lists or arrays, each converted
+                        to int16 and written in order
 
+                    totalsamples (int): the total number of samples
+
+                Returns:
+                    None
+        '''
+        if self.record == True:
+            self._record(samples)
 
         try:
 
@@ -378,8 +557,693 @@ class synth:
 
             if self.playback == True:
                 print("Playing...")
+                timer = self._timer
                 for i in samples:
-                    self.aud.write(np.int16(i))
+                    timer.mark()
+                    data = np.int16(i)
+                    timer.lap('conversion')
+                    self.aud.write(data)
+                    timer.lap('alsa write')
 
         except:
             pass
+
+
+    def _record(self, samples):
+        '''
+            Writes rendered audio to self.record_path.
+
+                Args:
+                    samples (list): of sample lists or arrays, written in
+                        order
+
+                Returns:
+                    None
+        '''
+        with self.open_record() as wav:
+            for i in samples:
+                wav.write(i)
+
+
+    def open_record(self):
+        '''
+            Opens self.record_path for writing, in self.record_format.
+
+                Returns:
+                    (wavwriter) taking blocks of rendered samples
+        '''
+        print('Recording to {}...'.format(self.record_path))
+        return Synth.wavwriter.wavwriter(
+            self.record_path, self.samplerate, self.record_format,
+            timer=self._timer
+        )
+
+
+    def seq_samples(self, sequence):
+        '''
+            Gives the number of samples a sequence renders to.
+
+                Args:
+                    sequence (list): a sequence in the format taken by play
+
+                Returns:
+                    (int) the total number of samples
+        '''
+        return sum(math.ceil(i[1] * self.samplerate) for i in sequence)
+
+
+    def _play_block(self, sequence, cancel=None, progress=None):
+        '''
+            Block engine: renders the sequence into one preallocated array
+            block by block, reusing the previous render as far as the
+            sequence is unchanged, and outputs it.
+        '''
+        out = self.rerender(sequence, cancel, progress)
+        if not out is None:
+            self._output([out], len(out))
+
+
+    def _play_pool(self, sequence):
+        '''
+            Pool engine: renders the notes of the sequence on worker
+            processes and outputs it.
+        '''
+        out = Synth.pool.render(self, sequence, self.workers)
+        self._output([out], len(out))
+
+
+    def _play_stream(self, sequence, cancel=None, progress=None):
+        '''
+            Streaming engine: plays the sequence period by period while it
+            renders, recording each block as it is rendered if recording
+            is on. A cancelled stream stops playing, and what was recorded
+            so far is kept.
+        '''
+        blocks = self._watch(
+            self.render(sequence), 0, self.seq_samples(sequence),
+            cancel, progress
+        )
+        wav = None
+
+        if self.record == True:
+            wav = self.open_record()
+            blocks = self._tee(blocks, wav)
+
+        periods = self._convert(blocks)
+
+        try:
+            if self.playback == True and self.playb_dis == False:
+                print("Playing...")
+                self.stream_stats = self._stream(
+                    periods, self.aud, self.blocksize
+                )
+                print('Time to first sample: {:.3f} s'.format(
+                    self.stream_stats['first_sample']
+                ))
+            else:
+                # Nothing to play, render anyway
+                for i in periods:
+                    pass
+        finally:
+            if not wav == None:
+                wav.close()
+
+
+    def _watch(self, blocks, done, total, cancel=None, progress=None):
+        '''
+            Passes blocks on, reporting progress after each one and
+            stopping once cancel is set.
+
+                Args:
+                    blocks: iterable of blocks of samples
+                    done: (int) samples rendered before the first block
+                    total: (int) samples to render in total
+                    cancel=None (threading.Event): stops the blocks
+                    progress=None (function): called as progress(done, total)
+
+                Returns:
+                    (generator) yielding the blocks
+        '''
+        for i in blocks:
+            done += len(i)
+            yield i
+
+            if not progress == None:
+                progress(done, total)
+            if not cancel == None and cancel.is_set():
+                print('Render cancelled.')
+                return
+
+
+    def _convert(self, blocks):
+        '''
+            Passes blocks on as int16 periods.
+        '''
+        timer = self._timer
+        for i in blocks:
+            timer.mark()
+            data = i.astype(np.int16)
+            timer.lap('conversion')
+            yield data
+
+
+    def _tee(self, blocks, wav):
+        '''
+            Passes blocks on, writing each one to wav first.
+        '''
+        for i in blocks:
+            wav.write(i)
+            yield i
+
+
+    def _play_realtime(self, sequence, cancel=None, progress=None):
+        '''
+            Real-time engine: plays the sequence through the ALSA device
+            as it renders. Without playback it renders like the streaming
+            engine.
+        '''
+        if self.playback == True and self.playb_dis == False:
+            print("Playing...")
+            self.play_realtime(sequence, cancel=cancel, progress=progress)
+            print('Underruns: {}, headroom: {:.1f} ms'.format(
+                self.realtime_stats['underruns'],
+                self.realtime_stats['headroom'] * 1000
+            ))
+        else:
+            self._play_stream(sequence, cancel, progress)
+
+
+    def play_realtime(self, sequence, pcm=None, periodsize=None,
+                      periods=None, cancel=None, progress=None):
+        '''
+            Plays a sequence in real time: a render thread keeps a ring of
+            periods rendered ahead of the device, and the device is given
+            silence if the ring runs dry. See Synth.realtime.run.
+
+                Args:
+                    sequence (list): a sequence in the format taken by play
+
+                    pcm=None: object with a write method taking int16
+                        samples and blocking while the device is full,
+                        defaults to the ALSA device self.aud. Use
+                        Synth.realtime.fakepcm without a sound card.
+
+                    periodsize=None (int): samples per period, defaults
+                        to self.periodsize
+
+                    periods=None (int): periods rendered ahead, defaults
+                        to self.periods
+
+                    cancel=None (threading.Event): set to stop playing
+
+                    progress=None (function): called as progress(done,
+                        total) after every period
+
+                Returns:
+                    (dict) counters of the run, also kept in
+                    self.realtime_stats (see Synth.realtime.run)
+        '''
+        if pcm == None:
+            pcm = self.aud
+        if periodsize == None:
+            periodsize = self.periodsize
+        if periods == None:
+            periods = self.periods
+
+        self.realtime_stats = Synth.realtime.run(
+            self, sequence, pcm, periodsize, periods, cancel, progress
+        )
+        return self.realtime_stats
+
+
+    def stream(self, sequence, period=None, pcm=None, queuesize=4):
+        '''
+            Renders a sequence and plays it as it renders. Rendering runs
+            on the calling thread and yields int16 periods; a writer thread
+            pushes each period to the PCM device while the next one is
+            rendered. At most queuesize rendered periods wait for the
+            writer.
+
+                Args:
+                    sequence (list): a sequence in the format taken by play
+
+                    period=None (int): samples per period, defaults to
+                        self.blocksize
+
+                    pcm=None: object with a write method taking int16
+                        samples, defaults to the ALSA device self.aud
+
+                    queuesize=4 (int): number of periods rendered ahead
+
+                Returns:
+                    (dict) timing of the stream, also kept in
+                    self.stream_stats:
+                        first_sample: seconds from the start of the call
+                            until the first period was handed to the device
+                        periods: number of periods written
+                        samples: number of samples written
+                        total: seconds the whole call took
+        '''
+        if period == None:
+            period = self.blocksize
+        if pcm == None:
+            pcm = self.aud
+
+        self.stream_stats = self._stream(
+            self.render_periods(sequence, period), pcm, period, queuesize
+        )
+        return self.stream_stats
+
+
+    def _stream(self, periods, pcm, period, queuesize=4):
+        '''
+            Writes an iterable of int16 periods to pcm from a writer thread
+            while the iterable is consumed on this thread. See stream.
+        '''
+        start = time.perf_counter()
+        stats = {'first_sample': None, 'periods': 0, 'samples': 0}
+        pending = queue.Queue(maxsize=queuesize)
+        failed = []
+        timer = self._timer
+
+        try:
+            pcm.setperiodsize(period)
+        except AttributeError:
+            pass
+
+        def _writer():
+            while True:
+                data = pending.get()
+                if data is None:
+                    return
+                if failed:
+                    # Keep draining so the renderer never blocks
+                    continue
+                try:
+                    begin = time.perf_counter()
+                    pcm.write(data)
+                    timer.add('alsa write', time.perf_counter() - begin)
+                except Exception as e:
+                    failed.append(e)
+                    continue
+
+                if stats['periods'] == 0:
+                    stats['first_sample'] = time.perf_counter() - start
+                stats['periods'] += 1
+                stats['samples'] += len(data)
+
+        writer = threading.Thread(target=_writer, daemon=True)
+        writer.start()
+
+        try:
+            for i in periods:
+                pending.put(i)
+        finally:
+            pending.put(None)
+            writer.join()
+
+        if failed:
+            raise failed[0]
+
+        stats['total'] = time.perf_counter() - start
+        return stats
+
+
+    def render_periods(self, sequence, period=None):
+        '''
+            This function is a generator that renders a sequence as int16
+            periods ready to be written to an audio device, each rendered
+            only when it is asked for.
+
+                Args:
+                    sequence (list): a sequence in the format taken by play
+
+                    period=None (int): samples per period, defaults to
+                        self.blocksize. The last period may be shorter.
+
+                Returns:
+                    (generator) yielding int16 ndarrays
+        '''
+        yield from self._convert(self.render(sequence, blocksize=period))
+
+
+    def rerender(self, sequence, cancel=None, progress=None):
+        '''
+            Renders a sequence with the block engine, reusing the previous
+            rerender up to the first step (sequence entry) that changed.
+
+            Every rerender keeps its output and a checkpoint of the render
+            state at the start of every step (see _checkpoint). If the
+            settings of the synth are the same as at the start or the end
+            of the previous rerender, the output up to the first changed step is
+            copied and rendering carries on from that step's checkpoint,
+            so an edit near the end of a long sequence only re-renders the
+            end. The result is the same as rendering the whole sequence
+            from the state the previous rerender started in.
+
+                Args:
+                    sequence (list): a sequence in the format taken by play
+
+                    cancel=None (threading.Event): set to stop rendering
+                        at the next block
+
+                    progress=None (function): called as progress(done,
+                        total) after every block
+
+                Returns:
+                    (ndarray) the output samples, or None if cancelled
+        '''
+        out = np.empty(self.seq_samples(sequence), dtype=self._dtypes()[1])
+        settings = self._settings()
+        last = self._last_render
+        checkpoints = []
+        resume = None
+
+        # LFOs leave the controls they modulate changed, so the settings
+        # the previous rerender ended with are as good as its start
+        if (not last == None
+                and settings in (last['settings'], last['end'])
+                and last['out'].dtype == out.dtype):
+            prev = last['sequence']
+            step = 0
+            while (step < min(len(prev), len(sequence))
+                    and prev[step] == sequence[step]):
+                step += 1
+
+            if step > 0:
+                settings = last['settings']
+                pos, state = last['checkpoints'][step]
+                out[:pos] = last['out'][:pos]
+                checkpoints = last['checkpoints'][:step]
+                resume = (step, pos, state)
+                print('Reusing {} of {} steps.'.format(step, len(sequence)))
+
+        # Blocks resume from the start of the block the step is in
+        done = 0
+        if not resume == None:
+            done = resume[1] - resume[1] % self.blocksize
+
+        blocks = self.render(
+            sequence, out=out, checkpoints=checkpoints, resume=resume
+        )
+        for block in self._watch(blocks, done, len(out), cancel, progress):
+            pass
+
+        if not cancel == None and cancel.is_set():
+            return None
+
+        self._last_render = {
+            'settings': settings,
+            'end': self._settings(),
+            'sequence': copy.deepcopy(sequence),
+            'checkpoints': checkpoints,
+            'out': out,
+        }
+        return out
+
+
+    def render(self, sequence, blocksize=None, out=None, checkpoints=None,
+               resume=None):
+        '''
+            This function is a generator that renders a sequence in blocks
+            of a fixed number of samples. Every block runs through the same
+            chain as the per-sample engine:
+                LFOs -> voices (osc -> envelope) -> mix -> fil1 -> fil2 -> clip
+
+            Voices are rendered together by the voice bank (self.bank). In
+            this engine the note of a sequence entry can also be a list of
+            notes, which are played together as a chord:
+                Ex. [[['C',4],['E',4],['G',4]],1] = C major for 1 second
+
+            Notes that were rendered before with the same settings are
+            copied from the note cache (self.notecache), unless an LFO
+            modulates an oscillator or envelope.
+
+            While an LFO is modulating a control, blocks are rendered in
+            stretches of the LFO's control_period samples and the control
+            values for the whole block are worked out up front by the
+            modulation matrix (self.matrix), then set at the start of each
+            stretch.
+
+                Args:
+                    sequence (list): a sequence in the format taken by play
+
+                    blocksize=None (int): samples per block, defaults to
+                        self.blocksize. The last block may be shorter.
+
+                    out=None (ndarray): optional preallocated float or
+                        int16 array of at least seq_samples(sequence)
+                        samples. If given, the yielded blocks are views
+                        into it. Blocks of an int16 array are rendered
+                        into a scratch block and converted when full.
+
+                    checkpoints=None (list): if given, (sample, state) is
+                        appended to it at the start of every step and once
+                        at the end, state being a _checkpoint
+
+                    resume=None (tuple): (step, sample, state) to start
+                        rendering at step from a checkpoint instead of at
+                        the beginning. out is needed and must already hold
+                        the samples before the step.
+
+                Returns:
+                    (generator) yielding float ndarrays of output samples
+        '''
+        if blocksize is None:
+            blocksize = self.blocksize
+
+        signal, output = self._dtypes()
+        convert = not out is None and out.dtype.kind == 'i'
+
+        totalsamples = self.seq_samples(sequence)
+        total_notes = len(sequence)
+        pos = 0
+        block = None
+        filled = 0
+        first = 0
+
+        if resume == None:
+            self.bank.reset()
+        else:
+            first, pos, state = resume
+            self._restore(state)
+
+            # Carry on inside the block the step starts in
+            filled = pos % blocksize
+            if filled > 0:
+                start = pos - filled
+                block = out[start:min(start + blocksize, totalsamples)]
+                if convert:
+                    block = block.astype(signal)
+
+        # Notes are not cached while an LFO changes the voices
+        self.bank.dtype = signal
+        self.bank.caching = not self.matrix.modulates(
+            ('oscil', 'oscil2', 'env1', 'env2')
+        )
+
+        for note_count, i in enumerate(sequence[first:], first + 1):
+            if not checkpoints == None:
+                checkpoints.append((pos, self._checkpoint()))
+
+            notes = self._chord(i[0])
+            time = i[1]
+            numsamples = math.ceil(time * self.samplerate)
+
+            for note in notes:
+                self.bank.allocate(note, time)
+
+            self.lfo1.get_retrig()
+            self.lfo2.get_retrig()
+            self.lfo3.get_retrig()
+
+            if notes:
+                print('Rendering {}. ({}/{})'.format(
+                    ', '.join('{} {}'.format(*j) for j in notes),
+                    note_count, total_notes
+                ))
+            else:
+                print('Rendering rest. ({}/{})'.format(note_count,total_notes))
+
+            while numsamples > 0:
+                if block is None:
+                    size = min(blocksize, totalsamples - pos)
+                    if out is None or convert:
+                        block = np.empty(size, dtype=signal)
+                    else:
+                        block = out[pos:pos + size]
+
+                count = min(len(block) - filled, numsamples)
+                self._render_chunk(block[filled:filled + count])
+                filled += count
+                numsamples -= count
+                pos += count
+
+                if filled == len(block):
+                    if convert:
+                        out[pos - filled:pos] = block
+                        block = out[pos - filled:pos]
+                    yield block
+                    block = None
+                    filled = 0
+
+        if not checkpoints == None:
+            checkpoints.append((pos, self._checkpoint()))
+
+
+    def _dtypes(self):
+        '''
+            Gives the dtypes of the voices and blocks, and of the output
+            of a whole render.
+        '''
+        if self.compact:
+            return np.float32, np.int16
+        return float, float
+
+
+    def _checkpoint(self):
+        '''
+            Gives a copy of the render state: the state of the voice bank
+            and the values of the devices, which hold both their settings
+            and running values such as LFO phases and past filter outputs.
+        '''
+        return {
+            'bank': self.bank.state(),
+            'devices': {
+                i: self._values(self.__dict__[i]) for i in DEVICES
+            },
+        }
+
+
+    def _restore(self, state):
+        '''
+            Puts the render state back to a checkpoint.
+        '''
+        self.bank.set_state(state['bank'])
+        for name, values in state['devices'].items():
+            self.__dict__[name].__dict__.update(values)
+
+        # Per-sample mip level is picked again
+        self.oscil._mip_freq = None
+        self.oscil2._mip_freq = None
+
+
+    def _settings(self):
+        '''
+            Gives the settings a render depends on, without the running
+            values that change while rendering.
+        '''
+        devices = tuple(
+            (i, tuple(
+                (k, v) for k, v in self._values(self.__dict__[i]).items()
+                if not k in RENDER_STATE
+            )) for i in DEVICES
+        )
+        return (
+            self.volume, self.samplerate, self.blocksize, self.bank.voices,
+            self.bank.alloc.policy, self.oscil.wavetable,
+            self.oscil2.wavetable, self.tuning.table.tobytes(), devices
+        )
+
+
+    def _values(self, device):
+        '''
+            Gives the plain values (numbers, strings, None) of a device.
+        '''
+        return {
+            k: v for k, v in device.__dict__.items()
+            if v is None or isinstance(v, (bool, int, float, str, np.generic))
+        }
+
+
+    def _chord(self, note):
+        '''
+            Gives the notes of a sequence entry as a list: empty for a
+            rest, one note for a note, or the notes of a chord.
+        '''
+        if note == None:
+            return []
+        if isinstance(note[0], str):
+            return [note]
+        return list(note)
+
+
+    def _render_chunk(self, buf):
+        '''
+            Renders len(buf) samples of the current note into buf, applying
+            LFO control values at every control point. Ramped routes (see
+            Synth.modmatrix) are given one value per sample, going linearly
+            to the next control point, and are left at the last of them.
+        '''
+        timer = self._timer
+
+        # Run LFO's
+        timer.mark()
+        values, setters, period, ramps = self.matrix.render(len(buf))
+        timer.lap('lfo')
+
+        if not setters:
+            self._render_stretch(buf)
+            return
+
+        ramped = [i for i, ramp in enumerate(ramps) if ramp]
+
+        for k, start in enumerate(range(0, len(buf), period)):
+            timer.mark()
+            stretch = buf[start:start + period]
+            for setter, ramp, value in zip(setters, ramps,
+                                           values[:, k].tolist()):
+                if not ramp:
+                    setter(value)
+
+            last = []
+            for i in ramped:
+                ramp = np.linspace(values[i, k], values[i, k + 1],
+                                   len(stretch), endpoint=False)
+                setters[i](ramp)
+                last.append(float(ramp[-1]))
+            timer.lap('lfo')
+
+            self._render_stretch(stretch)
+
+            # Controls are not left holding arrays
+            for i, value in zip(ramped, last):
+                setters[i](value)
+
+
+    def _render_stretch(self, buf):
+        '''
+            Renders len(buf) samples of the current note into buf with the
+            controls as they are.
+        '''
+        n = len(buf)
+
+        # Voices
+        self._timer.mark()
+        mix = self.bank.genBlock(n)
+        self._timer.lap('voices')
+        self._master(mix, buf)
+
+
+    def _master(self, mix, buf):
+        '''
+            Runs a block of summed voice output through the rest of the
+            chain into buf.
+        '''
+        timer = self._timer
+
+        # Mix and limit
+        timer.mark()
+        mix = np.clip(mix // 2, -32768, 32767)
+        timer.lap('mix')
+
+        # Filters
+        output = self.fil1.process_block(mix)
+        timer.lap('fil1')
+        output = self.fil2.process_block(output)
+        timer.lap('fil2')
+
+        # Limit and scale
+        np.multiply(np.clip(output, -32768, 32767), self.volume, out=buf)
+        timer.lap('mix')
+        timer.rendered(len(buf))
@@ -0,0 +1,244 @@
+import math
+import numbers
+import numpy as np
+
+''' Semitones of each note name above C, the same names as the sequencer '''
+NOTE_NAMES = [
+    "C", "CS", "D", "DS", "E", "F", "FS", "G", "GS", "A", "AS", "B"
+]
+NOTE_INDEX = {name: i for i, name in enumerate(NOTE_NAMES)}
+
+
+class tuning:
+    '''
+        This class is a tuning: a precomputed table holding the frequency
+        of every key over the full MIDI range (0 to 127). Notes are looked
+        up in the table instead of being worked out with pow on every use.
+
+        A note ['name', octave] is key octave*12 + semitones above C, so
+        ['A', 5] is key 69, the reference key. By default the tuning is
+        12 tone equal temperament with the reference key at 440 Hz, which
+        gives the same frequencies as wtOsc always has.
+
+        Alternative tunings can be loaded from Scala (.scl) files with
+        load_scala. Scale degrees are laid out on consecutive keys starting
+        from the reference key, which keeps the reference frequency.
+
+        Detune is in keys (semitones in equal temperament). Whole keys are
+        applied as an offset into the table; the fractional part as a
+        frequency ratio that is cached between calls.
+
+            Args:
+                reference=440: (float) frequency of the reference key in Hz
+
+                scale=None: (list) cents of each scale degree above the
+                    reference, ending with the period (usually 1200.0).
+                    Defaults to 12 tone equal temperament
+
+                root=69: (int) the reference key
+
+            Returns:
+                None
+    '''
+
+    size = 128
+
+    def __init__(self, reference=440, scale=None, root=69):
+        if scale == None:
+            scale = [100.0 * i for i in range(1, 13)]
+
+        self.reference = reference
+        self.root = root
+        self.scale = list(scale)
+        self.description = '12 tone equal temperament'
+        self._ratio = (0, 1.0)
+        self._build()
+
+
+    def set_reference(self, reference):
+        '''
+            Changes the frequency of the reference key.
+
+                Args:
+                    reference: (float) frequency in Hz
+
+                Returns:
+                    None
+        '''
+        self.reference = reference
+        self._build()
+
+
+    def set_scale(self, scale, description=''):
+        '''
+            Changes the scale.
+
+                Args:
+                    scale: (list) cents of each scale degree above the
+                        reference, ending with the period
+
+                    description='': (str) name of the scale
+
+                Returns:
+                    None
+        '''
+        if len(scale) == 0:
+            raise ValueError('a scale needs at least one degree')
+
+        self.scale = list(scale)
+        self.description = description
+        self._build()
+
+
+    def load_scala(self, path):
+        '''
+            Loads the scale from a Scala .scl file. Pitches with a '.' are
+            in cents, others are ratios (3/2) or whole numbers (2).
+
+                Args:
+                    path: location of the .scl file
+
+                Returns:
+                    None
+        '''
+        with open(path, encoding='latin-1') as f:
+            lines = [
+                i.strip() for i in f
+                if not i.lstrip().startswith('!')
+            ]
+
+        description = lines[0]
+        count = int(lines[1].split()[0])
+        pitches = [i.split()[0] for i in lines[2:] if i][:count]
+
+        if not len(pitches) == count:
+            raise ValueError('{} lists {} pitches, expected {}'.format(
+                path, len(pitches), count
+            ))
+
+        scale = []
+        for pitch in pitches:
+            if '.' in pitch:
+                scale.append(float(pitch))
+            else:
+                num, _, den = pitch.partition('/')
+                ratio = int(num) / int(den or 1)
+                if ratio <= 0:
+                    raise ValueError('bad pitch {} in {}'.format(pitch, path))
+                scale.append(1200 * math.log2(ratio))
+
+        self.set_scale(scale, description)
+
+
+    def key(self, note):
+        '''
+            Gives the key of a note.
+
+                Args:
+                    note: (list) containing two elements the string for the
+                        note, and the octave.
+                            Ex. ['A', 5] = key 69
+
+                Returns:
+                    (int) the key
+        '''
+        return note[1] * 12 + NOTE_INDEX[note[0]]
+
+
+    def freq(self, note, detune=0):
+        '''
+            Gives the frequency of a note.
+
+                Args:
+                    note: (list) the note, as taken by key, or a key (int)
+
+                    detune=0: (float) keys to detune by
+
+                Returns:
+                    (float) the frequency in Hz
+        '''
+        if not isinstance(note, numbers.Integral):
+            note = self.key(note)
+
+        whole = math.floor(detune)
+        key = note + whole
+        if 0 <= key < self.size:
+            freq = self.table[key]
+        else:
+            freq = self._freq(key)
+
+        if not detune == whole:
+            freq = freq * self._detune_ratio(detune - whole)
+
+        return float(freq)
+
+
+    def freqs(self, keys, detune=0):
+        '''
+            Gives the frequencies of many keys at once.
+
+                Args:
+                    keys: (ndarray) of int keys
+
+                    detune=0: (float) keys to detune by
+
+                Returns:
+                    (ndarray) of frequencies in Hz
+        '''
+        whole = math.floor(detune)
+        keys = np.asarray(keys) + whole
+
+        inside = (keys >= 0) & (keys < self.size)
+        if inside.all():
+            freqs = self.table[keys]
+        else:
+            freqs = np.array([self._freq(int(i)) for i in keys.ravel()])
+            freqs = freqs.reshape(keys.shape)
+
+        if not detune == whole:
+            freqs = freqs * self._detune_ratio(detune - whole)
+
+        return freqs
+
+
+    def _detune_ratio(self, fraction):
+        '''
+            Gives the frequency ratio of a fraction of a key, reusing the
+            last one worked out if the fraction is the same.
+        '''
+        if not self._ratio[0] == fraction:
+            self._ratio = (fraction, 2 ** (self._step_cents(fraction) / 1200))
+        return self._ratio[1]
+
+
+    def _step_cents(self, fraction):
+        '''
+            Gives the cents of a fraction of a key, taking the average step
+            of the scale as the size of one key.
+        '''
+        return fraction * self.scale[-1] / len(self.scale)
+
+
+    def _build(self):
+        '''
+            Fills the frequency table.
+        '''
+        self.table = np.array([self._freq(i) for i in range(self.size)])
+
+
+    def _freq(self, key):
+        '''
+            Works out the frequency of a key from the scale.
+        '''
+        steps = key - self.root
+        octave, degree = divmod(steps, len(self.scale))
+
+        cents = octave * self.scale[-1]
+        if degree > 0:
+            cents += self.scale[degree - 1]
+
+        return self.reference * 2 ** (cents / 1200)
+
+
+# The tuning used by oscillators that are not given one
+standard = tuning()
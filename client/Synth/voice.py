@@ -1,6 +1,8 @@
 import Synth.osc
 import Synth.envelope
+import collections
 import math
+import numpy as np
 
 class voice:
 
@@ -19,6 +21,8 @@ class voice:
         self.freq2 = freq2
         self.phase1 = phase1
         self.phase2 = phase2
+        self.detune1 = None
+        self.detune2 = None
         self.in_use = False
 
 
@@ -27,6 +31,8 @@ class voice:
             self.note = note
             self.freq1 = self.osc1.gen_freq(self.note)
             self.freq2 = self.osc2.gen_freq(self.note)
+            self.detune1 = self.osc1.detune
+            self.detune2 = self.osc2.detune
             self.phase1 = self.osc1.pOffset
             self.phase2 = self.osc2.pOffset
             self.notesamp = self.samplerate * time
@@ -41,14 +47,22 @@ class voice:
             self.in_use = False
             return None
         else:
-            self.osc1.freq = self.osc1.gen_freq(self.note)
-            self.osc2.freq = self.osc2.gen_freq(self.note)
-            self.osc1.phase = self.phase1
-            self.osc2.phase = self.phase2
+            # Frequencies only change with the detune
+            if not self.detune1 == self.osc1.detune:
+                self.freq1 = self.osc1.gen_freq(self.note)
+                self.detune1 = self.osc1.detune
+            if not self.detune2 == self.osc2.detune:
+                self.freq2 = self.osc2.gen_freq(self.note)
+                self.detune2 = self.osc2.detune
+
+            self.osc1.freq = self.freq1
+            self.osc2.freq = self.freq2
+            self.osc1.phasor = self.phase1
+            self.osc2.phasor = self.phase2
             sig1 = self.osc1.genOutput()
             sig2 = self.osc2.genOutput()
-            self.phase1 = self.osc1.phase
-            self.phase2 = self.osc2.phase
+            self.phase1 = self.osc1.phasor
+            self.phase2 = self.osc2.phasor
 
             sus_samples1 = (
                 self.notesamp
@@ -88,3 +102,535 @@ class voice:
             self.curr_sample += 1
 
             return [tot, sig_count]
+
+
+class voicebank:
+    '''
+        This class holds the state of a number of voices in parallel numpy
+        arrays (one element per voice) so that all playing voices are
+        rendered together with array operations. Each voice has its own
+        oscillator phases, frequencies, position in its note and note
+        length; the oscillators and envelopes themselves are shared, as
+        with voice.
+
+        Voices are handed out by an allocator, which steals a playing
+        voice when all are busy according to its policy (see allocator).
+
+        With a note cache, a note that was rendered to its end before
+        with the same settings is copied from the cache instead of being
+        rendered again. Set caching to False while the settings change
+        during notes (LFO modulation).
+
+        Voice output is kept in dtype: float (float64) or np.float32,
+        which halves the size of the blocks and of the cached notes.
+        Phases and frequencies stay float64.
+
+            Args:
+                osc1, osc2: (wtOsc) the oscillators
+                env1, env2: (envelope) the envelopes
+                voices=8: (int) the number of voices
+                steal='oldest': (str) voice stealing policy of the allocator
+                samplerate=44100: (int) the sample rate
+                cache=None: (notecache) the note cache, None for no caching
+                dtype=float: the dtype of the output samples
+
+            Returns:
+                None
+    '''
+
+    def __init__(self, osc1, osc2, env1, env2, voices=8, steal='oldest',
+                 samplerate=44100, cache=None, dtype=float):
+        self.samplerate = samplerate
+        self.dtype = dtype
+        self.osc1 = osc1
+        self.osc2 = osc2
+        self.env1 = env1
+        self.env2 = env2
+        self.cache = cache
+        self.caching = True
+        self.alloc = allocator(voices, steal)
+        self.resize(voices)
+
+
+    def resize(self, voices):
+        '''
+            Sets the number of voices, stopping every voice.
+
+                Args:
+                    voices: (int) the number of voices
+
+                Returns:
+                    None
+        '''
+        self.voices = voices
+        self.alloc.resize(voices)
+        self.notes = [None] * voices
+        self.times = [None] * voices
+        self.keys = np.zeros(voices, dtype=np.intp)
+        self.active = np.zeros(voices, dtype=bool)
+        self.phase1 = np.zeros(voices)
+        self.phase2 = np.zeros(voices)
+        self.freq1 = np.zeros(voices)
+        self.freq2 = np.zeros(voices)
+        self.curr_sample = np.zeros(voices, dtype=np.int64)
+        self.notesamp = np.zeros(voices)
+
+        # Per voice: the cached render being played, or the key of the
+        # note and the buffer it is being recorded into for the cache
+        self.cached = [None] * voices
+        self.note_keys = [None] * voices
+        self.recording = [None] * voices
+
+        # detune the frequencies were worked out for
+        self._detune1 = None
+        self._detune2 = None
+
+
+    def reset(self):
+        '''
+            Stops every voice.
+        '''
+        self.active[:] = False
+        self.alloc.reset()
+
+
+    def allocate(self, note, time):
+        '''
+            Starts a note on a voice given by the allocator.
+
+                Args:
+                    note: (list) the note, as taken by wtOsc.gen_freq
+                    time: (float) the length of the note in seconds
+
+                Returns:
+                    (int) the voice, or None if the note was dropped
+        '''
+        i = self.alloc.allocate(note, self.level)
+        if not i == None:
+            self.load_note(i, note, time)
+        return i
+
+
+    def level(self, i):
+        '''
+            Gives the current envelope level of a voice.
+
+                Args:
+                    i: (int) the voice
+
+                Returns:
+                    (float) the sum of both envelope gains
+        '''
+        return float(
+            self.env1.render(self.notesamp[i], self.curr_sample[i], 1)[0]
+            + self.env2.render(self.notesamp[i], self.curr_sample[i], 1)[0]
+        )
+
+
+    def load_note(self, i, note, time):
+        '''
+            Starts a note on a voice.
+
+                Args:
+                    i: (int) the voice
+                    note: (list) the note, as taken by wtOsc.gen_freq
+                    time: (float) the length of the note in seconds
+
+                Returns:
+                    None
+        '''
+        self._update_freqs()
+
+        self.notes[i] = note
+        self.times[i] = time
+        self.keys[i] = self.osc1.tuning.key(note)
+        self.freq1[i] = self.osc1.tuning.freq(note, self.osc1.detune)
+        self.freq2[i] = self.osc2.tuning.freq(note, self.osc2.detune)
+        self.phase1[i] = self.osc1.pOffset % self.osc1.wavetsize
+        self.phase2[i] = self.osc2.pOffset % self.osc2.wavetsize
+        self.notesamp[i] = self.samplerate * time
+        self.curr_sample[i] = 0
+        self.active[i] = True
+
+        self.cached[i] = None
+        self.note_keys[i] = None
+        self.recording[i] = None
+        if not self.cache == None and self.caching == True:
+            key = self.note_key(note, time)
+            self.cached[i] = self.cache.get(key)
+            if self.cached[i] is None:
+                self.note_keys[i] = key
+                self.recording[i] = np.zeros(
+                    math.floor(self.notesamp[i]) + 1, dtype=self.dtype
+                )
+
+
+    def note_key(self, note, time):
+        '''
+            Gives the note cache key of a note: the note, its length and
+            every oscillator and envelope setting the output of a voice
+            depends on, and the dtype it is kept in. Detune and tuning are
+            covered by the frequencies.
+
+                Args:
+                    note: (list) the note, as taken by wtOsc.gen_freq
+                    time: (float) the length of the note in seconds
+
+                Returns:
+                    (tuple) the key
+        '''
+        return (
+            tuple(note), self.samplerate * time,
+            self.osc1.tuning.freq(note, self.osc1.detune),
+            self.osc2.tuning.freq(note, self.osc2.detune),
+        ) + tuple(
+            (osc.wavetable, osc.wavetablepos, osc.volume, osc.pOffset,
+             osc.enable, osc.samplerate)
+            for osc in (self.osc1, self.osc2)
+        ) + tuple(
+            (env.attacksamples, env.decaysamples, env.sustain_amp,
+             env.releasesamples, env.enable)
+            for env in (self.env1, self.env2)
+        ) + (np.dtype(self.dtype).str,)
+
+
+    def state(self):
+        '''
+            Gives a copy of the state of every voice, to be restored with
+            set_state. Notes being recorded for the note cache are not
+            kept.
+
+                Returns:
+                    (dict) the state
+        '''
+        state = {
+            i: self.__dict__[i].copy() for i in (
+                'keys', 'active', 'phase1', 'phase2', 'freq1', 'freq2',
+                'curr_sample', 'notesamp', 'notes', 'times', 'cached'
+            )
+        }
+        state['_detune1'] = self._detune1
+        state['_detune2'] = self._detune2
+        state['alloc'] = self.alloc.state()
+        return state
+
+
+    def set_state(self, state):
+        '''
+            Restores a state given by state.
+
+                Args:
+                    state: (dict) the state
+
+                Returns:
+                    None
+        '''
+        for name, value in state.items():
+            if not name == 'alloc':
+                self.__dict__[name] = value.copy() if hasattr(
+                    value, 'copy'
+                ) else value
+
+        self.voices = len(self.active)
+        self.note_keys = [None] * self.voices
+        self.recording = [None] * self.voices
+        self.alloc.set_state(state['alloc'])
+
+
+    def genBlock(self, n):
+        '''
+            Generates a block of output for all playing voices, summed.
+            A voice stops once it gets past the end of its note.
+
+                Args:
+                    n: (int) the number of samples to generate
+
+                Returns:
+                    (ndarray) of n samples
+        '''
+        idx = np.flatnonzero(self.active)
+        if len(idx) == 0:
+            return np.zeros(n, dtype=self.dtype)
+
+        self._update_freqs()
+
+        hit = np.array([not self.cached[i] is None for i in idx.tolist()])
+        out = np.empty((len(idx), n), dtype=self.dtype)
+
+        if not hit.all():
+            out[~hit] = self._render(idx[~hit], n)
+
+        if hit.any():
+            # Phases are kept going in case the voice is rendered again
+            played = idx[hit]
+            for phase, freq, osc in ((self.phase1, self.freq1, self.osc1),
+                                     (self.phase2, self.freq2, self.osc2)):
+                phase[played] = np.mod(
+                    phase[played]
+                    + n * osc.wavetsize * freq[played] / osc.samplerate,
+                    osc.wavetsize
+                )
+
+        for row in np.flatnonzero(hit).tolist():
+            i = idx[row]
+            start = self.curr_sample[i]
+            samples = self.cached[i][start:start + n]
+            out[row, :len(samples)] = samples
+            out[row, len(samples):] = 0
+
+        self.curr_sample[idx] += n
+        self.active[idx] = self.curr_sample[idx] <= np.floor(self.notesamp[idx])
+
+        if not self.cache == None:
+            self._record(idx, out, n)
+
+        for i in idx[~self.active[idx]].tolist():
+            self.alloc.release(i)
+
+        return out.sum(axis=0)
+
+
+    def _render(self, idx, n):
+        '''
+            Renders a block of output for the voices idx, one row each.
+        '''
+        sig1, self.phase1[idx] = self.osc1.genBank(
+            self.phase1[idx], self.freq1[idx], n
+        )
+        sig2, self.phase2[idx] = self.osc2.genBank(
+            self.phase2[idx], self.freq2[idx], n
+        )
+
+        # Feed into envelope
+        start = self.curr_sample[idx, None]
+        notesamp = self.notesamp[idx, None]
+        out = (
+            sig1 * self.env1.render(notesamp, start, n)
+            + sig2 * self.env2.render(notesamp, start, n)
+        )
+
+        # Silence each voice past the end of its note
+        last = np.floor(notesamp) - start
+        out[np.arange(n) > last] = 0
+
+        return out
+
+
+    def _record(self, idx, out, n):
+        '''
+            Copies a block of output of the voices being recorded into
+            their buffers, and caches the notes that ended. A note is only
+            cached if the settings are still the ones it started with.
+        '''
+        for row, i in enumerate(idx.tolist()):
+            buf = self.recording[i]
+            if buf is None:
+                continue
+
+            start = self.curr_sample[i] - n
+            count = max(min(n, len(buf) - start), 0)
+            buf[start:start + count] = out[row, :count]
+
+            if self.active[i] == False:
+                self.recording[i] = None
+                key = self.note_key(self.notes[i], self.times[i])
+                if key == self.note_keys[i]:
+                    self.cache.put(key, buf)
+
+
+    def _update_freqs(self):
+        '''
+            Works the voice frequencies out again if an oscillator's
+            detune changed since they were last worked out.
+        '''
+        if not self._detune1 == self.osc1.detune:
+            self.freq1 = self.osc1.tuning.freqs(self.keys, self.osc1.detune)
+            self._detune1 = self.osc1.detune
+            self._drop_cached()
+        if not self._detune2 == self.osc2.detune:
+            self.freq2 = self.osc2.tuning.freqs(self.keys, self.osc2.detune)
+            self._detune2 = self.osc2.detune
+            self._drop_cached()
+
+
+    def _drop_cached(self):
+        '''
+            Stops playing and recording cached renders, which no longer
+            match the settings. Voices playing cached renders go on being
+            rendered instead.
+        '''
+        self.cached = [None] * self.voices
+        self.recording = [None] * self.voices
+
+
+class allocator:
+    '''
+        This class hands out voices in constant time. Free voices are kept
+        in a free list and playing voices in order of age, along with the
+        voice playing each note. When every voice is busy a voice is stolen
+        according to the policy:
+
+            'oldest'    the voice that started first
+            'quietest'  the voice with the lowest envelope level
+            'retrigger' a note that is already playing restarts on its own
+                        voice; other notes steal the oldest voice
+            'none'      nothing is stolen, the note is dropped
+
+        Counts allocations, steals, retriggers and drops.
+
+            Args:
+                voices=8: (int) the number of voices
+                policy='oldest': (str) the stealing policy
+
+            Returns:
+                None
+    '''
+
+    policies = ('oldest', 'quietest', 'retrigger', 'none')
+
+    def __init__(self, voices=8, policy='oldest'):
+        if policy not in self.policies:
+            raise ValueError('unknown voice stealing policy {}'.format(policy))
+
+        self.policy = policy
+        self.resize(voices)
+
+
+    def resize(self, voices):
+        '''
+            Sets the number of voices, freeing every voice and clearing
+            the counters.
+        '''
+        self.voices = voices
+        self.allocations = 0
+        self.steals = 0
+        self.retriggers = 0
+        self.drops = 0
+        self.reset()
+
+
+    def reset(self):
+        '''
+            Frees every voice.
+        '''
+        self.free = collections.deque(range(self.voices))
+        self.active = collections.OrderedDict()
+        self.playing = dict()
+
+
+    def allocate(self, note, level=None):
+        '''
+            Gives a voice for a new note.
+
+                Args:
+                    note: (list) the note, used to find retriggers
+                    level=None: (function) gives the envelope level of a
+                        voice, needed by the 'quietest' policy
+
+                Returns:
+                    (int) the voice, or None if the note was dropped
+        '''
+        key = tuple(note)
+
+        if self.policy == 'retrigger' and key in self.playing:
+            i = self.playing[key]
+            self.retriggers += 1
+
+        elif self.free:
+            i = self.free.popleft()
+
+        elif self.policy == 'none' or not self.active:
+            self.drops += 1
+            return None
+
+        else:
+            if self.policy == 'quietest' and not level == None:
+                i = min(self.active, key=level)
+            else:
+                i = next(iter(self.active))
+            self.steals += 1
+
+        self._stop(i)
+        self.active[i] = key
+        self.playing[key] = i
+        self.allocations += 1
+        return i
+
+
+    def state(self):
+        '''
+            Gives a copy of the free and playing voices and the counters,
+            to be restored with set_state.
+
+                Returns:
+                    (dict) the state
+        '''
+        return {
+            'voices': self.voices,
+            'free': collections.deque(self.free),
+            'active': collections.OrderedDict(self.active),
+            'playing': dict(self.playing),
+            'allocations': self.allocations,
+            'steals': self.steals,
+            'retriggers': self.retriggers,
+            'drops': self.drops,
+        }
+
+
+    def set_state(self, state):
+        '''
+            Restores a state given by state.
+
+                Args:
+                    state: (dict) the state
+
+                Returns:
+                    None
+        '''
+        self.__dict__.update(state)
+        self.free = collections.deque(state['free'])
+        self.active = collections.OrderedDict(state['active'])
+        self.playing = dict(state['playing'])
+
+
+    def release(self, i):
+        '''
+            Returns a voice whose note has ended to the free list.
+
+                Args:
+                    i: (int) the voice
+
+                Returns:
+                    None
+        '''
+        if i in self.active:
+            self._stop(i)
+            self.free.append(i)
+
+
+    def stats(self):
+        '''
+            Gives the allocation counters.
+
+                Returns:
+                    (dict) with voices, active, allocations, steals,
+                    retriggers and drops
+        '''
+        return {
+            'voices': self.voices,
+            'active': len(self.active),
+            'allocations': self.allocations,
+            'steals': self.steals,
+            'retriggers': self.retriggers,
+            'drops': self.drops,
+        }
+
+
+    def _stop(self, i):
+        '''
+            Removes a voice from the playing voices, if it is playing.
+        '''
+        key = self.active.pop(i, None)
+        if not key == None and self.playing.get(key) == i:
+            del self.playing[key]
+
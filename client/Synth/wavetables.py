@@ -1,65 +1,343 @@
-import wave
+import collections
 import math
+import os
 import struct
+import threading
+import numpy as np
+
+# WAVE format tags
+WAVE_FORMAT_PCM = 0x0001
+WAVE_FORMAT_IEEE_FLOAT = 0x0003
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
 
 class wavetable:
     ''' This class allows for wav files to be parsed into a wavetable.
         All wavetables created using Serum by Xfer, specifically Serum's wavetable editor.
 
-            Only supports single channel wav files.
+            Supports 8, 16, 24 and 32 bit PCM and 32/64 bit IEEE float wav
+            files. Files with more than one channel are downmixed to mono.
 
         Args:
             wav: the location of the file to be parsed
 
         Returns:
-            a list of signed 16 bytes in Little Endian form corresponding to
-            a wavetable with n frames(n wavetable positions) of 2048 samples
-                The list is of length n*2048
+            a float32 numpy array of signed samples scaled to the 16 bit
+            range, corresponding to a wavetable with n frames(n wavetable
+            positions) of 2048 samples
+                The array has shape (n, 2048)
+
+            Band-limited copies of the table (mips) are built once with the
+            table, see build_mips.
     '''
 
+    # Harmonics a 2048 sample frame can hold
+    harmonics = 1024
+
     def __init__(self,wav=None):
         if wav == None:
             return
 
         else:
             self.table = self.parse_wavtab(wav)
+            self.mips = self.build_mips(self.table)
 
 
-    def parse_wavtab(self, wav=None):
+    def nbytes(self):
+        '''
+            Gives the memory used by the parsed table and its mips in bytes.
+        '''
+        return self.table.nbytes + self.mips.nbytes
+
+
+    def build_mips(self, table):
+        '''
+            Builds one band-limited copy of the table per octave. Level k
+            keeps the first harmonics >> k harmonics of every frame and
+            drops the rest with an FFT, so level 0 is the table itself and
+            the last level is a sine.
+
+            Args:
+                table: (ndarray) frames x 2048 samples
+
+            Returns:
+                a float32 numpy array of shape (levels, n*2048), each level
+                flat like the phasor indexes it
         '''
-            This function parses wavetable data from the provided wav file
+        levels = int(math.log2(self.harmonics)) + 1
+        mips = np.empty((levels, table.size), dtype=np.float32)
+        mips[0] = table.reshape(-1)
+
+        spectrum = np.fft.rfft(table, axis=1)
+        for k in range(1, levels):
+            spectrum[:, (self.harmonics >> k) + 1:] = 0
+            mips[k] = np.fft.irfft(
+                spectrum, n=table.shape[1], axis=1
+            ).reshape(-1)
+
+        return mips
 
-                Only supports single channel wav files.
+
+    def parse_wavtab(self, wav=None):
+        '''
+            This function parses wavetable data from the provided wav file.
+            The whole data chunk is read at once and decoded with numpy.
 
             Args:
                 wav: the location of the file to be parsed
 
             Returns:
-                a list of signed 16 bytes in Little Endian form corresponding
-                to a wavetable with n frames(n wavetable positions) of 2048
+                a contiguous float32 numpy array of signed samples scaled to
+                the 16 bit range (-32768 to 32767), corresponding to a
+                wavetable with n frames(n wavetable positions) of 2048
                 samples
-                    The list is of length n*2048
+                    The array has shape (n, 2048)
         '''
         if wav == None:
             return
 
-        with wave.open(wav,mode='rb') as wav:
+        with open(wav, mode='rb') as f:
+            fmt, data = self._read_chunks(f)
+
+        tag, channels, width = fmt
+        samples = self._decode(data, tag, width)
+
+        # Drop a trailing partial frame then downmix
+        num_frame = len(samples)//channels
+        samples = samples[:num_frame*channels]
+        if channels > 1:
+            samples = samples.reshape(num_frame, channels).mean(
+                axis=1, dtype=np.float32
+            )
+
+        num_frame = num_frame - num_frame%2048
+        if num_frame == 0:
+            raise ValueError(
+                '{} holds less than 2048 samples per channel'.format(wav)
+            )
+
+        return np.ascontiguousarray(
+            samples[:num_frame], dtype=np.float32
+        ).reshape(-1, 2048)
+
+
+    def _read_chunks(self, f):
+        '''
+            Walks the RIFF chunks of an open wav file.
+
+            Args:
+                f: a binary file object positioned at the start of the file
+
+            Returns:
+                ((format tag, channels, bytes per sample), data bytes)
+        '''
+        riff, size, wave = struct.unpack('<4sI4s', f.read(12))
+        if not (riff == b'RIFF' and wave == b'WAVE'):
+            raise ValueError('not a RIFF/WAVE file')
+
+        fmt = None
+        while True:
+            header = f.read(8)
+            if len(header) < 8:
+                raise ValueError('wav file has no data chunk')
+
+            name, size = struct.unpack('<4sI', header)
+
+            if name == b'fmt ':
+                chunk = f.read(size)
+                tag, channels, rate, byterate, align, bits = struct.unpack(
+                    '<HHIIHH', chunk[:16]
+                )
+                if tag == WAVE_FORMAT_EXTENSIBLE:
+                    # The real format is the start of the sub-format GUID
+                    tag = struct.unpack('<H', chunk[24:26])[0]
+                fmt = (tag, channels, align//channels)
+
+            elif name == b'data':
+                if fmt == None:
+                    raise ValueError('wav data chunk comes before fmt chunk')
+                return fmt, f.read(size)
+
+            else:
+                f.seek(size, 1)
+
+            # Chunks are word aligned
+            if size % 2:
+                f.seek(1, 1)
+
+
+    def _decode(self, data, tag, width):
+        '''
+            Decodes raw little endian sample data to signed floats scaled
+            to the 16 bit range.
+
+            Args:
+                data: (bytes) the raw data chunk
+                tag: (int) the wav format tag
+                width: (int) bytes per sample
+
+            Returns:
+                a flat float32 numpy array of samples
+        '''
+        data = data[:len(data) - len(data)%width]
+
+        if tag == WAVE_FORMAT_IEEE_FLOAT and width in (4, 8):
+            samples = np.frombuffer(data, dtype='<f{}'.format(width))
+            return (samples * 32768).astype(np.float32)
+
+        if not tag == WAVE_FORMAT_PCM:
+            raise ValueError('unsupported wav format tag {}'.format(tag))
+
+        if width == 1:
+            # 8 bit wav is unsigned
+            samples = np.frombuffer(data, dtype=np.uint8)
+            return (samples.astype(np.float32) - 128) * 256
+
+        if width == 2:
+            return np.frombuffer(data, dtype='<i2').astype(np.float32)
 
-            num_frame = wav.getnframes()
-            if not num_frame%2048 == 0:
-                num_frame = num_frame - num_frame%2048
+        if width == 3:
+            # Place each 3 byte sample in the top of an int32
+            raw = np.frombuffer(data, dtype=np.uint8).reshape(-1, 3)
+            samples = np.zeros((len(raw), 4), dtype=np.uint8)
+            samples[:, 1:] = raw
+            samples = samples.view('<i4').reshape(-1)
+            return samples.astype(np.float32) / 65536
 
-            frames = []
+        if width == 4:
+            samples = np.frombuffer(data, dtype='<i4')
+            return samples.astype(np.float32) / 65536
+
+        raise ValueError('unsupported wav sample width {}'.format(width))
+
+
+class registry:
+    ''' A process-wide cache of parsed wavetables. Tables are keyed by
+        their resolved path and modification time, so every oscillator
+        that selects the same file shares one read-only table, and a file
+        that changes on disk is parsed again.
+
+        Cached tables are kept in least recently used order. When the
+        total size of the cached tables goes over the memory budget the
+        least recently used ones are dropped from the cache (oscillators
+        still using them keep their reference).
+
+        Args:
+            budget=64*1024*1024: (int) memory budget in bytes
+
+        Returns:
+            None
+    '''
+
+    def __init__(self, budget=64*1024*1024):
+        self.budget = budget
+        self.tables = collections.OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+
+    def get(self, wav):
+        '''
+            Gives the wavetable for a wav file, parsing it only if it is
+            not cached yet.
+
+            Args:
+                wav: the location of the wav file
+
+            Returns:
+                a wavetable object whose table and mips arrays are read-only
+        '''
+        path = os.path.realpath(wav)
+        key = (path, os.stat(path).st_mtime_ns)
+
+        with self.lock:
+            if key in self.tables:
+                self.hits += 1
+                self.tables.move_to_end(key)
+                return self.tables[key]
+
+        table = wavetable(wav=path)
+        table.table.flags.writeable = False
+        table.mips.flags.writeable = False
+
+        with self.lock:
+            self.misses += 1
+
+            if key in self.tables:
+                # Parsed by another thread meanwhile
+                self.tables.move_to_end(key)
+                return self.tables[key]
+
+            # Drop older versions of the same file
+            for old in [i for i in self.tables if i[0] == path]:
+                self.size -= self.tables.pop(old).nbytes()
+
+            self.tables[key] = table
+            self.size += table.nbytes()
+            self._evict()
+
+        return table
+
+
+    def set_budget(self, budget):
+        '''
+            Changes the memory budget, evicting tables if needed.
+
+            Args:
+                budget: (int) memory budget in bytes
+
+            Returns:
+                None
+        '''
+        with self.lock:
+            self.budget = budget
+            self._evict()
+
+
+    def clear(self):
+        '''
+            Drops every cached table. Counters are kept.
+        '''
+        with self.lock:
+            self.tables.clear()
+            self.size = 0
+
+
+    def stats(self):
+        '''
+            Gives the cache counters.
+
+            Returns:
+                (dict) with hits, misses, evictions, tables, size and budget
+        '''
+        with self.lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'tables': len(self.tables),
+                'size': self.size,
+                'budget': self.budget,
+            }
+
+
+    def _evict(self):
+        '''
+            Drops least recently used tables until the cache fits the
+            budget. The most recent table is always kept.
+        '''
+        while self.size > self.budget and len(self.tables) > 1:
+            key, table = self.tables.popitem(last=False)
+            self.size -= table.nbytes()
+            self.evictions += 1
 
-            #read all frames
-            for i in range (0, num_frame):
-                frame = wav.readframes(1)
-                frame = struct.unpack('<H', frame)
-                frames.append(frame[0])
 
-            return frames
+# The registry shared by every oscillator in the process
+tables = registry()
 
 
 if __name__ == "__main__":
     table = wavetable(wav='basic.wav')
-    print(table)
+    print(table.table)
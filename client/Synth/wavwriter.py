@@ -0,0 +1,150 @@
+import struct
+import numpy as np
+import Synth.stages
+from Synth.wavetables import WAVE_FORMAT_PCM, WAVE_FORMAT_IEEE_FLOAT
+
+# Sample formats: (wav format tag, bytes per sample)
+FORMATS = {
+    'int16': (WAVE_FORMAT_PCM, 2),
+    'int24': (WAVE_FORMAT_PCM, 3),
+    'float32': (WAVE_FORMAT_IEEE_FLOAT, 4),
+}
+
+
+class wavwriter:
+    ''' This class writes a mono wav file block by block as audio is
+        rendered. Samples are taken in the range of the synth's output
+        (the 16 bit range, -32768 to 32767) and written as 16 or 24 bit
+        PCM, or 32 bit float scaled to -1 to 1.
+
+        The header is written with the file and its sizes are filled in
+        by close, so nothing but the block being written is held in
+        memory. Use it as a context manager or call close.
+
+        Args:
+            path: the location of the file to write
+
+            samplerate=44100: (int) the sample rate
+
+            format='int16': (str) the sample format, one of 'int16',
+                'int24' or 'float32'
+
+            timer=None: (stagetimer) adds the time spent converting and
+                writing to its conversion and wav write stages
+
+        Returns:
+            None
+    '''
+
+    # Samples converted at a time, so big writes do not double in memory
+    chunk = 65536
+
+    def __init__(self, path, samplerate=44100, format='int16', timer=None):
+        if format not in FORMATS:
+            raise ValueError('unsupported wav sample format {}'.format(format))
+
+        self.path = path
+        self.samplerate = samplerate
+        self.format = format
+        self.tag, self.width = FORMATS[format]
+        self.frames = 0
+        self.timer = Synth.stages.NULL if timer is None else timer
+
+        # 24 bit samples are cast into this before their bytes are packed
+        self.scratch = None
+        if format == 'int24':
+            self.scratch = np.empty(self.chunk, dtype='<i4')
+
+        self.file = open(path, mode='wb')
+        self.file.write(self._header())
+
+
+    def write(self, samples):
+        '''
+            Appends samples to the file.
+
+            Args:
+                samples: (ndarray or list) samples in the 16 bit range
+
+            Returns:
+                None
+        '''
+        samples = np.asarray(samples)
+        timer = self.timer
+
+        for start in range(0, len(samples), self.chunk):
+            timer.mark()
+            data = self._convert(samples[start:start + self.chunk])
+            timer.lap('conversion')
+            self.file.write(data)
+            timer.lap('wav write')
+
+        self.frames += len(samples)
+
+
+    def close(self):
+        '''
+            Fills in the sizes in the header and closes the file.
+        '''
+        if self.file.closed:
+            return
+
+        # Chunks are word aligned
+        if self.frames * self.width % 2:
+            self.file.write(b'\0')
+
+        self.file.seek(0)
+        self.file.write(self._header())
+        self.file.close()
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+    def _convert(self, samples):
+        '''
+            Converts a block of at most chunk samples to the bytes of the
+            sample format with a single cast.
+        '''
+        if self.format == 'int16':
+            return samples.astype('<i2', copy=False)
+
+        if self.format == 'float32':
+            return np.multiply(samples, 1/32768, dtype='<f4')
+
+        # 24 bit: the low three bytes of each 32 bit sample. The float
+        # scale makes int16 samples multiply without overflowing.
+        scratch = self.scratch[:len(samples)]
+        np.multiply(samples, 256.0, out=scratch, casting='unsafe')
+        return scratch.view(np.uint8).reshape(-1, 4)[:, :3].tobytes()
+
+
+    def _header(self):
+        '''
+            Gives the RIFF header for the samples written so far.
+        '''
+        data = self.frames * self.width
+        align = self.width
+        fmt = struct.pack(
+            '<HHIIHH', self.tag, 1, self.samplerate,
+            self.samplerate * align, align, self.width * 8
+        )
+
+        chunks = b''
+        if self.tag == WAVE_FORMAT_IEEE_FLOAT:
+            # Non-PCM formats have a cbSize field and a fact chunk
+            fmt += struct.pack('<H', 0)
+            chunks = b'fact' + struct.pack('<II', 4, self.frames)
+
+        chunks = (
+            b'fmt ' + struct.pack('<I', len(fmt)) + fmt + chunks
+            + b'data' + struct.pack('<I', data)
+        )
+        riff = 4 + len(chunks) + data + data % 2
+
+        return b'RIFF' + struct.pack('<I', riff) + b'WAVE' + chunks
@@ -0,0 +1,324 @@
+''' Benchmarks of the synth components.
+
+Measures samples per second of each component (oscillator, envelope,
+filter, LFO, voice), per sample and per block, and of whole renders of
+standard sequences with synth.play. No audio device is needed.
+
+Results can be saved as a JSON baseline and later compared against it;
+benchmarks more than the threshold slower than the baseline are flagged
+and the exit status is 1.
+
+Usage:
+    python bench.py --save baseline.json
+    python bench.py --compare baseline.json --threshold 0.1
+    python bench.py -k block
+'''
+
+import argparse
+import contextlib
+import io
+import json
+import math
+import os
+import platform
+import sys
+import time
+
+with contextlib.redirect_stdout(io.StringIO()):
+    import numpy as np
+    import Synth
+    import Synth.envelope
+    import Synth.filt
+    import Synth.osc
+    import Synth.voice
+
+# Synth loads its default wavetables relative to this directory, so main
+# runs the benchmarks from here
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+WAV = os.path.join(HERE, 'Synth', 'wavetables', 'basic.wav')
+
+''' Standard sequences rendered by the synth.play benchmarks '''
+SEQUENCES = {
+    'melody': [
+        [[name, octave], 0.25]
+        for octave in (4, 5) for name in ('C', 'D', 'E', 'F', 'G', 'A', 'B')
+    ] + [[None, 0.25], [['C', 6], 1]],
+    'chords': [
+        [[['C', 4], ['E', 4], ['G', 4]], 0.5],
+        [[['F', 4], ['A', 4], ['C', 5]], 0.5],
+        [[['G', 4], ['B', 4], ['D', 5]], 0.5],
+        [[['C', 4], ['E', 4], ['G', 4], ['C', 5]], 1],
+    ],
+}
+
+
+def _quiet_synth(**kw):
+    ''' Gives a synth that neither plays nor records, without opening
+    the audio device. '''
+    with contextlib.redirect_stdout(io.StringIO()):
+        synth = Synth.synth(audio=False, **kw)
+    synth.playback = False
+    synth.record = False
+    return synth
+
+
+def _osc():
+    osc = Synth.osc.wtOsc(wav=WAV)
+    osc.freq = 440
+    return osc
+
+
+def _env():
+    env = Synth.envelope.envelope(44100, 0.1, 0.2, 1, 0.5, 0.3)
+    env.sustainsamples = 44100
+    return env
+
+
+# Each benchmark sets up what it needs and gives a function doing the
+# work of rendering n samples, which is all that is timed
+
+def bench_osc_sample(n):
+    osc = _osc()
+    gen = osc.genOutput
+    def work():
+        for i in range(n):
+            gen()
+    return work
+
+
+def bench_osc_block(n):
+    osc = _osc()
+    def work():
+        for i in range(0, n, 1024):
+            osc.genBlock(1024)
+    return work
+
+
+def bench_env_sample(n):
+    env = _env()
+    def work():
+        for i in range(n):
+            env.gen_env(i, 1.0)
+    return work
+
+
+def bench_env_block(n):
+    env = _env()
+    def work():
+        for i in range(0, n, 1024):
+            env.render(88200, i, 1024)
+    return work
+
+
+def bench_filter_sample(n):
+    fil = Synth.filt.filter()
+    fil.set_cutoff_lowpass(2000)
+    x = np.random.default_rng(0).uniform(-32768, 32767, n).tolist()
+    def work():
+        for i in range(1, n):
+            fil.generate_output(x[i - 1:i + 1])
+    return work
+
+
+def bench_filter_block(n):
+    fil = Synth.filt.filter()
+    fil.set_cutoff_lowpass(2000)
+    x = np.random.default_rng(0).uniform(-32768, 32767, n)
+    def work():
+        for i in range(0, n, 1024):
+            fil.process_block(x[i:i + 1024])
+    return work
+
+
+def bench_lfo_sample(n):
+    gen = _quiet_synth().lfo1.genOutput
+    def work():
+        for i in range(n):
+            gen()
+    return work
+
+
+def bench_lfo_block(n):
+    lfo = _quiet_synth().lfo1
+    def work():
+        for i in range(0, n, 1024):
+            lfo.genBlock(1024)
+    return work
+
+
+def bench_voice_sample(n):
+    voice = _quiet_synth().voices[0]
+    voice.load_note(['A', 4], n / 44100 + 1)
+    def work():
+        for i in range(n):
+            voice.genOutput()
+    return work
+
+
+def bench_voicebank_block(n):
+    bank = _quiet_synth().bank
+    bank.cache = None
+    for i, name in enumerate(('C', 'D', 'E', 'F', 'G', 'A', 'B', 'C')):
+        bank.allocate([name, 4 + i // 7], n / 44100 + 1)
+    def work():
+        for i in range(0, n, 1024):
+            bank.genBlock(1024)
+    return work
+
+
+def _play(engine, sequence, lfo=False):
+    ''' Gives a benchmark rendering a sequence with synth.play. '''
+    def bench(n):
+        synth = _quiet_synth(engine=engine, workers=1)
+        synth.fil1.set_cutoff_lowpass(2000)
+        if lfo:
+            synth.lfo1.set_device_control('oscil', 'volume')
+            synth.lfo1.amount = 0.5
+            synth.lfo2.set_device_control('fil1', 'cutoff')
+            synth.lfo2.amount = 0.3
+        def work():
+            with contextlib.redirect_stdout(io.StringIO()):
+                synth.play(sequence)
+        return work
+    # As synth.seq_samples, at the synth's sample rate
+    bench.samples = sum(math.ceil(i[1] * 44100) for i in sequence)
+    return bench
+
+
+''' name: (function giving the work of rendering n samples, n) '''
+BENCHMARKS = {
+    'osc.sample': (bench_osc_sample, 20000),
+    'osc.block': (bench_osc_block, 441000),
+    'envelope.sample': (bench_env_sample, 50000),
+    'envelope.block': (bench_env_block, 441000),
+    'filter.sample': (bench_filter_sample, 50000),
+    'filter.block': (bench_filter_block, 441000),
+    'lfo.sample': (bench_lfo_sample, 50000),
+    'lfo.block': (bench_lfo_block, 441000),
+    'voice.sample': (bench_voice_sample, 10000),
+    'voicebank.block': (bench_voicebank_block, 441000),
+}
+# The sample engine is slow, it renders a quarter of the melody only.
+# It does not play chords.
+BENCHMARKS['play.sample.melody'] = (
+    _play('sample', [[i[0], i[1] / 4] for i in SEQUENCES['melody']]), None
+)
+for _name, _seq in SEQUENCES.items():
+    for _engine in ('block', 'pool'):
+        BENCHMARKS['play.{}.{}'.format(_engine, _name)] = (
+            _play(_engine, _seq), None
+        )
+    BENCHMARKS['play.block.{}.lfo'.format(_name)] = (
+        _play('block', _seq, lfo=True), None
+    )
+
+
+def run(names, repeat=3):
+    '''
+        Runs benchmarks, keeping the best of repeat runs of each.
+
+            Args:
+                names: (list) names of the benchmarks to run
+                repeat=3: (int) runs of each benchmark
+
+            Returns:
+                (dict) samples per second by benchmark name
+    '''
+    results = {}
+    for name in names:
+        bench, n = BENCHMARKS[name]
+        if n == None:
+            n = bench.samples
+
+        best = None
+        for i in range(repeat):
+            work = bench(n)
+            start = time.perf_counter()
+            work()
+            took = time.perf_counter() - start
+            if best == None or took < best:
+                best = took
+
+        results[name] = n / best
+        print('{:<28}{:>14,.0f} samples/s'.format(name, results[name]))
+
+    return results
+
+
+def compare(results, baseline, threshold):
+    '''
+        Compares results against a baseline.
+
+            Args:
+                results: (dict) samples per second by benchmark name
+                baseline: (dict) the same for the baseline
+                threshold: (float) slowdown flagged as a regression,
+                    0.1 = 10% fewer samples per second
+
+            Returns:
+                (list) names of the benchmarks that regressed
+    '''
+    regressions = []
+    print()
+    print('{:<28}{:>14}{:>14}{:>9}'.format(
+        'benchmark', 'baseline', 'now', 'change'
+    ))
+    for name, now in results.items():
+        if not name in baseline:
+            continue
+        before = baseline[name]
+        change = now / before - 1
+        flag = ''
+        if change < -threshold:
+            flag = '  REGRESSION'
+            regressions.append(name)
+        print('{:<28}{:>14,.0f}{:>14,.0f}{:>+8.1%}{}'.format(
+            name, before, now, change, flag
+        ))
+
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Benchmark the synth components.'
+    )
+    parser.add_argument('-k', '--select', default='',
+                        help='only run benchmarks whose name contains this')
+    parser.add_argument('-r', '--repeat', type=int, default=3,
+                        help='runs of each benchmark, the best is kept')
+    parser.add_argument('--save', metavar='FILE',
+                        help='save the results as a JSON baseline')
+    parser.add_argument('--compare', metavar='FILE',
+                        help='compare the results against a JSON baseline')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help='slowdown flagged as a regression (default 0.1)')
+    args = parser.parse_args(argv)
+
+    # Paths given on the command line are taken from where it was run
+    cwd = os.getcwd()
+    os.chdir(HERE)
+    sys.path.insert(0, HERE)
+
+    names = [i for i in BENCHMARKS if args.select in i]
+    results = run(names, args.repeat)
+
+    if args.save:
+        with open(os.path.join(cwd, args.save), 'w') as f:
+            json.dump({
+                'python': platform.python_version(),
+                'numpy': np.__version__,
+                'machine': platform.machine(),
+                'results': results,
+            }, f, indent=2)
+
+    if args.compare:
+        with open(os.path.join(cwd, args.compare)) as f:
+            baseline = json.load(f)['results']
+        if compare(results, baseline, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
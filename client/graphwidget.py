@@ -1,3 +1,4 @@
+import numpy as np
 import tkinter
 from tkinter.constants import *
 
@@ -30,9 +31,10 @@ class GraphScreen:
             maximum range of y which will be drawn. (As a region,
             (o, height].) To set different drawing ranges, scale
             the bound function mathematically.
-        fx: (function): function that takes an integer and returns
-            an integer. This is the function that will be drawn
-            to the graph. '''
+        fx: (function): function that takes an array of integers
+            (every x from 0 to width - 1) and returns an array of
+            integers, y for each x, or None to draw nothing. This is
+            the function that will be drawn to the graph. '''
 
     def __init__(self, parent, width, height, fx):
         ''' Initializer for GraphScreen - sets up a canvas,
@@ -44,12 +46,17 @@ class GraphScreen:
         self.height = height
         self.parent = parent
         self.image = None
+        self.imageobj = None
 
         # unique id
         self.uid = g_next_uid()
 
-        # function bitmap
-        self.bits = bytearray(width*height//8)
+        # function bitmap, one row per y from the top
+        self.bits = np.zeros((height, width), dtype=bool)
+
+        # x for every column, and y for every row from the top
+        self._xs = np.arange(width)
+        self._ys = np.arange(height - 1, -1, -1)[:, None]
 
         # encapsulated widget
         self.widget = tkinter.Canvas(
@@ -67,22 +74,20 @@ class GraphScreen:
         ''' Draws a representation of the function fx
         to the encapsulated canvas. '''
 
-        # save previous y for interpolation
-        yprev = None
-
-        for x in range(self.width):
-            y = self.fx(x)
-            self._write_column(x, y, yprev)
-            yprev = y
+        y = self.fx(self._xs)
+        if y is None:
+            self.bits[:] = False
+        else:
+            self._write_columns(np.asarray(y))
         self._make_bitmap()
 
 
     def _make_bitmap(self):
-        ''' Turns the stored bits created by _write_column etc
+        ''' Turns the stored bits created by _write_columns
         into a bitmap that Tkinter can parse. '''
 
         # get bitmap data
-        self.bitmap = imgutil.tobitmap(self.bits, self.width, self.height)
+        self.bitmap = imgutil.tobitmap(self.bits)
 
         # make or modify Tkinter image object
         if self.image is None:
@@ -95,41 +100,30 @@ class GraphScreen:
         else:
             self.image.configure(data=self.bitmap)
 
-        # draw to canvas
-        self.imageobj = self.widget.create_image(
-            1, 1,
-            anchor=NW,
-            image=self.image
-        )
-
-
-    def _write_column(self, x, y, yprev=None):
-        ''' Sets pixel y in column x on and the rest of the pixels
-        in the column off. If yprev is specified, interpolates
-        from the given value by filling in the pixels in column x
-        between the two y-values, giving a continuous graph (given
-        yprev is actually the previous y). '''
-
-        for yi in range(self.height):
-            if (yi == y
-                or (yprev is not None and y < yi < yprev)
-                or (yprev is not None and yprev < yi < y)):
-                    self._write_bit(x, yi, True)
-            else:
-                self._write_bit(x, yi, False)
+        # draw to canvas once, the item shows the image as it changes
+        if self.imageobj is None:
+            self.imageobj = self.widget.create_image(
+                1, 1,
+                anchor=NW,
+                image=self.image
+            )
 
 
-    def _write_bit(self, x, y, parity):
-        ''' Writes a single bit on or off to the bitmap. '''
+    def _write_columns(self, y):
+        ''' Sets pixel y[x] in each column x on and the rest of the
+        pixels off. Each column also fills in the pixels between its
+        y and the previous column's, giving a continuous graph. '''
 
-        bitidx = (self.height - 1 - y) * self.width + x
-        byteidx = bitidx // 8
-        bytemask = 0b1 << (( 7 - bitidx) % 8)
+        # previous y, the first column has none to join up with
+        yprev = np.empty_like(y)
+        yprev[0] = y[0]
+        yprev[1:] = y[:-1]
+        lo = np.minimum(y, yprev)
+        hi = np.maximum(y, yprev)
 
-        if parity == True:
-            self.bits[byteidx] |= bytemask
-        else:
-            self.bits[byteidx] &= (~bytemask)
+        ys = self._ys
+        np.equal(ys, y, out=self.bits)
+        self.bits |= (ys > lo) & (ys < hi)
 
 
     def pack(self, **kwargs):
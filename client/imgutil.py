@@ -1,8 +1,21 @@
-from PIL import Image
+import numpy as np
 
-def tobitmap(data, width, height):
-    ''' Converts to the X11 bitmap format via PIL. '''
+# Text of every byte value, as written in X11 bitmaps
+_HEX = ['0x{:02x}'.format(i) for i in range(256)]
 
-    img = Image.frombytes(mode='1', size=(width,height), data=bytes(data))
+def tobitmap(plane, name='image'):
+    ''' Converts a 2D boolean array, True where a pixel is on and
+    the first row at the top, to the X11 bitmap format. '''
 
-    return img.tobitmap()
+    height, width = plane.shape
+
+    # X11 bitmaps store each row padded to whole bytes, first pixel
+    # in the lowest bit
+    data = np.packbits(plane, axis=1, bitorder='little')
+
+    return (
+        '#define {0}_width {1}\n#define {0}_height {2}\n'
+        'static char {0}_bits[] = {{\n{3}\n}};\n'
+    ).format(name, width, height, ','.join(
+        map(_HEX.__getitem__, data.ravel().tolist())
+    ))
@@ -0,0 +1,163 @@
+''' Headless batch renderer.
+
+Renders sequence files to wav files without the GUI. A sequence file is
+a JSON list in the format taken by Synth.play, rests being null:
+
+    [[["A", 4], 0.5], [null, 0.25], [[["C", 4], ["E", 4]], 1]]
+
+Presets are JSON files of synth settings (see Synth.preset.apply). Every
+sequence is rendered with every preset given, or with the default synth
+if none is, to <outdir>/<sequence>.wav or <outdir>/<sequence>_<preset>.wav.
+Inputs with the same name get a number added, <sequence>-2.wav and so on.
+No sound device is opened.
+
+Usage:
+    python render.py song.json other.json -p bright.json -o renders -j 4
+'''
+
+import argparse
+import contextlib
+import json
+import multiprocessing
+import os
+import sys
+import time
+
+# Synth loads its default wavetables relative to this directory
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def render_job(job):
+    ''' Renders one sequence with one preset. Runs in a worker process
+    when rendering in parallel.
+
+    Returns (seconds of audio, seconds taken). '''
+    seq_path, preset_path, out, args = job
+    with open(seq_path) as f:
+        sequence = json.load(f)
+
+    with contextlib.ExitStack() as stack:
+        log = sys.stdout
+        if not args.verbose:
+            log = stack.enter_context(open(os.devnull, 'w'))
+        stack.enter_context(contextlib.redirect_stdout(log))
+
+        import Synth
+        import Synth.preset
+
+        preset = {}
+        if not preset_path == None:
+            preset = Synth.preset.load(preset_path)
+
+        synth_args = Synth.preset.synth_args(preset)
+        if not args.engine == None:
+            synth_args['engine'] = args.engine
+        synth_args.setdefault('engine', 'block')
+        if args.compact:
+            synth_args['compact'] = True
+        if synth_args['engine'] == 'pool' and args.jobs > 1:
+            # Pool workers can not start their own pools
+            synth_args['engine'] = 'block'
+
+        # Only files are written, the sound device is left alone
+        synth = Synth.synth(audio=False, **synth_args)
+        Synth.preset.apply(synth, preset)
+
+        synth.playback = False
+        synth.record = True
+        synth.record_path = out
+        synth.record_format = args.format
+
+        start = time.perf_counter()
+        synth.play(sequence)
+        took = time.perf_counter() - start
+
+    return synth.seq_samples(sequence) / synth.samplerate, took
+
+
+def _name(path):
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Render sequence files to wav files without the GUI.'
+    )
+    parser.add_argument('sequences', nargs='+',
+                        help='JSON sequence files')
+    parser.add_argument('-p', '--preset', action='append', default=[],
+                        help='JSON synth preset, may be given more than once')
+    parser.add_argument('-o', '--outdir', default='.',
+                        help='directory to write the wav files to')
+    parser.add_argument('-f', '--format', default='int16',
+                        choices=('int16', 'int24', 'float32'),
+                        help='sample format of the wav files')
+    parser.add_argument('-e', '--engine', default=None,
+                        choices=('sample', 'block', 'stream', 'pool'),
+                        help='render engine, overrides the presets '
+                             '(default block)')
+    parser.add_argument('-c', '--compact', action='store_true',
+                        help='render in float32 into int16 output, using '
+                             'less memory')
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help='number of renders to run in parallel')
+    parser.add_argument('-v', '--verbose', action='store_true',
+                        help='show the output of the synth')
+    args = parser.parse_args(argv)
+
+    # Paths are taken from where the command was run
+    outdir = os.path.abspath(args.outdir)
+    os.makedirs(outdir, exist_ok=True)
+    presets = [os.path.abspath(i) for i in args.preset] or [None]
+
+    jobs = []
+    used = set()
+    for seq in args.sequences:
+        for preset in presets:
+            name = _name(seq)
+            if not preset == None and len(presets) > 1:
+                name = '{}_{}'.format(name, _name(preset))
+
+            # Inputs from different directories can share a name
+            unique = name
+            count = 1
+            while unique in used:
+                count += 1
+                unique = '{}-{}'.format(name, count)
+            used.add(unique)
+
+            out = os.path.join(outdir, unique + '.wav')
+            jobs.append((os.path.abspath(seq), preset, out, args))
+
+    cwd = os.getcwd()
+    os.chdir(HERE)
+    sys.path.insert(0, HERE)
+
+    start = time.perf_counter()
+    if args.jobs > 1 and len(jobs) > 1:
+        with multiprocessing.Pool(min(args.jobs, len(jobs))) as pool:
+            results = pool.map(render_job, jobs, chunksize=1)
+    else:
+        results = [render_job(i) for i in jobs]
+    total = time.perf_counter() - start
+
+    rows = [
+        (os.path.relpath(job[2], cwd), '{:.2f}'.format(audio),
+         '{:.2f}'.format(took), '{:.2f}x'.format(audio / max(took, 1e-9)))
+        for job, (audio, took) in zip(jobs, results)
+    ]
+    header = ('output', 'audio s', 'wall s', 'realtime')
+    widths = [max(len(r[i]) for r in rows + [header]) for i in range(4)]
+    line = '  '.join('{{:<{}}}'.format(w) for w in widths)
+
+    print(line.format(*header))
+    for row in rows:
+        print(line.format(*row))
+
+    audio = sum(i[0] for i in results)
+    print('{} renders, {:.2f} s of audio in {:.2f} s ({:.2f}x realtime)'
+          .format(len(jobs), audio, total, audio / max(total, 1e-9)))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,7 @@
 # For graphics
+import threading
 import tkinter
+import traceback
 from tkinter.constants import *
 
 # Custom widget-like definitions
@@ -9,6 +11,7 @@ import dialwidget
 
 # Synthesizer
 import Synth
+import Synth.stages
 
 
 class PlaybackController:
@@ -20,6 +23,10 @@ class PlaybackController:
 
     Note that self.seqsource should be set after this class's instantiation
     for playback to actually work.
+
+    Rendering runs on a background worker thread so the interface stays
+    responsive. progress holds (samples done, total samples) of the render
+    in progress, or None, for the interface to poll.
     '''
 
     def __init__(self, synth):
@@ -34,6 +41,13 @@ class PlaybackController:
         # current speed
         self._play_speed = 0.5
 
+        # background render worker, started by the first render
+        self.progress = None
+        self._worker = None
+        self._pending = None
+        self._cancel = threading.Event()
+        self._wake = threading.Condition()
+
 
     def get_sequence(self):
         ''' Retrieves and returns a sequence of notes from the
@@ -54,12 +68,56 @@ class PlaybackController:
 
 
     def start(self):
-        ''' Invokes the synthesizer to start rendering the sequence available
-        in seqsource. '''
+        ''' Queues the sequence available in seqsource to be rendered by
+        the background worker. A render still in progress is cancelled at
+        its next block and this one replaces it. '''
         seq = self.get_sequence()
-        print("Rendering...")
-        self.synth.play(seq)
-        print("Done.")
+
+        with self._wake:
+            self._pending = seq
+            self._cancel.set()
+            self._wake.notify()
+
+        if self._worker == None:
+            self._worker = threading.Thread(target=self._run, daemon=True)
+            self._worker.start()
+
+
+    def cancel(self):
+        ''' Cancels the render in progress and any queued render. '''
+        with self._wake:
+            self._pending = None
+            self._cancel.set()
+
+
+    def _run(self):
+        ''' Background worker: renders queued sequences one at a time. '''
+        while True:
+            with self._wake:
+                while self._pending == None:
+                    self._wake.wait()
+                seq = self._pending
+                self._pending = None
+                cancel = self._cancel = threading.Event()
+
+            print("Rendering...")
+            self.progress = (0, 1)
+            try:
+                self.synth.play(seq, cancel=cancel, progress=self._progress)
+            except Exception:
+                traceback.print_exc()
+            finally:
+                self.progress = None
+
+            if not cancel.is_set():
+                print("Done.")
+                if self.synth.instrument:
+                    print(Synth.stages.format_report(self.synth.render_report))
+
+
+    def _progress(self, done, total):
+        ''' Called by the synth from the worker thread. '''
+        self.progress = (done, total)
 
 
     def toggle_record(self):
@@ -68,6 +126,12 @@ class PlaybackController:
         self._toggle_msg(self.synth.record, "Recording")
 
 
+    def toggle_instrument(self):
+        '''Sets synth.instrument. '''
+        self.synth.instrument = not(self.synth.instrument)
+        self._toggle_msg(self.synth.instrument, "Profiling")
+
+
     def toggle_playback(self):
         '''Sets synth.playback. '''
         if self.synth.playb_dis == False:
@@ -101,6 +165,12 @@ def gen_controlbar(tk, ctrl):
         _update_button(bar2_play, ctrl.synth.playback)
 
 
+    def _toggle_instrument():
+        ''' Callback function for the profiling toggle. '''
+        ctrl.toggle_instrument()
+        _update_button(bar2_prof, ctrl.synth.instrument)
+
+
     def _update_button(button, target):
         if target:
             button.configure(bg="gray75")
@@ -108,6 +178,19 @@ def gen_controlbar(tk, ctrl):
             button.configure(bg="gray50")
 
 
+    def _poll_progress():
+        ''' Shows the progress of the background render on the Render
+        button. Polled since only this thread may touch widgets. '''
+        progress = ctrl.progress
+        if progress == None:
+            bar1_render.configure(text="Render")
+        else:
+            bar1_render.configure(text="{}%".format(
+                100 * progress[0] // max(progress[1], 1)
+            ))
+        tk.after(100, _poll_progress)
+
+
     panel = tkinter.Frame(
         tk,
         relief=RAISED,
@@ -138,6 +221,7 @@ def gen_controlbar(tk, ctrl):
         text="Render",
         font="Fixed 9",
         command=ctrl.start,
+        width=6,
         bd=1,
         highlightthickness=0,
     )
@@ -169,17 +253,30 @@ def gen_controlbar(tk, ctrl):
         highlightthickness=0,
     )
 
+    bar2_prof = tkinter.Button(
+        bar2,
+        bg="gray50",
+        text="Profile",
+        font="Fixed 9",
+        command=_toggle_instrument,
+        bd=1,
+        highlightthickness=0,
+    )
+
 
     bar1_dial.pack(side=LEFT, pady=3, padx=3)
     bar1_render.pack(side=LEFT, expand=1, pady=3,padx=3)
     bar2_play.pack(side=LEFT, expand=1,pady=3,padx=3)
     bar2_rec.pack(side=LEFT, expand=1,pady=3,padx=3)
+    bar2_prof.pack(side=LEFT, expand=1,pady=3,padx=3)
     bar1.pack(side=BOTTOM, expand=1)
     bar2.pack(side=BOTTOM, expand=1)
 
     # consistency
     _update_button(bar2_play, ctrl.synth.playback)
     _update_button(bar2_rec, ctrl.synth.record)
+    _update_button(bar2_prof, ctrl.synth.instrument)
+    _poll_progress()
 
     return panel
 
@@ -297,7 +394,7 @@ def setup(synth):
 if __name__ == '__main__':
     ''' Loads synthesizer and starts graphical interface. '''
 
-    synthesizer = Synth.synth()
+    synthesizer = Synth.synth(engine='block')
 
     tk = setup(synthesizer)
 
@@ -1,4 +1,6 @@
 # for graphics
+import numpy as np
+import time
 import tkinter
 from tkinter.constants import *
 
@@ -16,6 +18,10 @@ PANEL_GS_HEIGHT = 64
 PANEL_GS_WIDTH = PANEL_WIDTH
 PANEL_FONT = "Fixed"
 
+''' Most times per second a panel's graph is redrawn. Redraws
+asked for in between are put off and done together. '''
+PANEL_MAX_FPS = 30
+
 
 class SynthPanel:
     ''' Base control panel widget. Every control panel has three panels:
@@ -53,6 +59,11 @@ class SynthPanel:
         self.target = target
         self.enabled = False
 
+        # redraw scheduling: max_fps can be changed per panel
+        self.max_fps = PANEL_MAX_FPS
+        self._dirty = False
+        self._last_redraw = 0
+
         # encapsulated widget
         self.widget = tkinter.Frame(
             parent,
@@ -142,14 +153,33 @@ class SynthPanel:
     def _graph_fx(self, x):
         ''' This is the function that will be displayed on the graph.
         It should be overridden in each subclass by a function that
-        takes an integer and returns an integer. '''
+        takes an array of integers and returns an array of integers
+        (see GraphScreen). '''
         pass
 
 
     def redraw(self):
-        ''' Redraws the panel's graph screen. '''
-        if self._has_graph:
-            self.w_graph.redraw()
+        ''' Marks the panel's graph screen to be redrawn. Redraws
+        happen when Tk is idle, at most max_fps times a second, so
+        a fast dial drag redraws once per frame rather than once
+        per mouse event. '''
+        if not self._has_graph or self._dirty:
+            return
+        self._dirty = True
+
+        wait = self._last_redraw + 1 / self.max_fps - time.monotonic()
+        if wait > 0:
+            self.widget.after(int(wait * 1000) + 1, self._flush_redraw)
+        else:
+            self.widget.after_idle(self._flush_redraw)
+
+
+    def _flush_redraw(self):
+        ''' Redraws the panel's graph screen now. Called by Tk
+        after redraw. '''
+        self._dirty = False
+        self._last_redraw = time.monotonic()
+        self.w_graph.redraw()
 
 
     def _make_dials(self):
@@ -360,14 +390,14 @@ class OscPanel(SynthPanel):
 
         # converts x in (0, width) to (framestart, framestart+framesize)
         # for lookup in wavetable.
-        wtx = self.target.wavetablepos + (
+        wtx = int(self.target.wavetablepos) + (
               (self.target.wavetsize * x) // PANEL_GS_WIDTH)
 
-        # looks up wtx in wavetable and converts unsigned to signed
-        wtval = (self.target.wave_tables[wtx] + 32768) % 65536
+        # looks up wtx in wavetable and offsets signed to unsigned
+        wtval = self.target.wave_samples[wtx] + 32768
 
         # scales wtval to panel height size
-        return PANEL_GS_HEIGHT * wtval // 65536
+        return (PANEL_GS_HEIGHT * wtval // 65536).astype(int)
 
 
     def _set_waveshape(self, value, label):
@@ -434,19 +464,20 @@ class EnvPanel(SynthPanel):
         ''' Checks the envelope response for each moment in time.
         Uses the actual envelope function so should be accurate. '''
 
-        # set a representative note length. this makes the graph
-        # look better and should be overwritten before any notes
-        # are actually played.
-        self.target.sustainsamples = 0.25 * self.target.samplerate
+        # a representative note length, sustaining for a quarter of a
+        # second. this makes the graph look better.
+        env = self.target
+        note = (0.25 * env.samplerate
+                + env.attacksamples + env.decaysamples + env.releasesamples)
 
         # converts x in (0, width) to time domain for a scale of 1
-        t = ((1 * x / PANEL_GS_WIDTH) * self.target.samplerate)
+        t = ((1 * x / PANEL_GS_WIDTH) * env.samplerate)
 
         # gets unscaled envelope response for that time
-        envval = self.target.gen_env(t, 1)
+        envval = env.render(note, t[:, None], 1)[:, 0]
 
         # converts to panel scale
-        return int(envval * (PANEL_GS_HEIGHT - 4))
+        return (envval * (PANEL_GS_HEIGHT - 4)).astype(int)
 
 
 class FiltPanel(SynthPanel):
@@ -523,9 +554,10 @@ class FiltPanel(SynthPanel):
 
         # frequency curve calculation and scaling
         if self.band == "High Pass":
-            return int(PANEL_GS_HEIGHT / (1 + self.target.cutoff_hp / freq))
+            y = PANEL_GS_HEIGHT / (1 + self.target.cutoff_hp / freq)
         else:
-            return int(PANEL_GS_HEIGHT / (1 + freq / self.target.cutoff_lp))
+            y = PANEL_GS_HEIGHT / (1 + freq / self.target.cutoff_lp)
+        return y.astype(int)
 
 
     def _log_set_cutoff(self, value, label):
@@ -0,0 +1,78 @@
+import contextlib
+import io
+import os
+import sys
+
+import numpy as np
+import pytest
+
+# Synth loads its default wavetables relative to the client directory
+HERE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, HERE)
+
+with contextlib.redirect_stdout(io.StringIO()):
+    import Synth
+
+
+PERIOD = 64
+
+
+@pytest.fixture(autouse=True)
+def client_dir(monkeypatch):
+    monkeypatch.chdir(HERE)
+
+
+def _render(lfo=True, interpolate=True):
+    ''' Renders one note through oscil alone, nothing but its volume
+    shaping the wave, with lfo1 on the volume if lfo is set. '''
+    with contextlib.redirect_stdout(io.StringIO()):
+        synth = Synth.synth(engine='block', audio=False)
+        for device in (synth.oscil2, synth.env1, synth.env2,
+                       synth.fil1, synth.fil2):
+            device.enable = False
+
+        if lfo:
+            synth.lfo1.set_device_control('oscil', 'volume')
+            synth.lfo1.set_speed(20)
+            synth.lfo1.amount = 1
+            synth.lfo1.offset = 0
+            synth.lfo1.control_period = PERIOD
+            synth.lfo1.interpolate = interpolate
+
+        return synth.rerender([[['A', 4], 0.1]])
+
+
+def _ratios(out, ref):
+    ''' The volume the LFO gave each sample, where the wave is loud
+    enough to tell, and where those samples are. '''
+    loud = np.abs(ref) > 2000
+    return out[loud] / ref[loud], np.flatnonzero(loud)
+
+
+def test_interpolated_volume_ramps_inside_control_period():
+    ref = _render(lfo=False)
+    out = _render(interpolate=True)
+    ratio, where = _ratios(out, ref)
+
+    # Within a control period the volume keeps changing...
+    period = where // PERIOD
+    spans = [np.ptp(ratio[period == k]) for k in np.unique(period)]
+    assert max(spans) > 0.02
+
+    # ...smoothly, with no step at the control points
+    steps = np.abs(np.diff(ratio))[np.diff(where) == 1]
+    assert steps.max() < 0.01
+
+
+def test_held_volume_steps_at_control_points():
+    ref = _render(lfo=False)
+    out = _render(interpolate=False)
+    ratio, where = _ratios(out, ref)
+
+    period = where // PERIOD
+    same = (np.diff(where) == 1) & (np.diff(period) == 0)
+    across = (np.diff(where) == 1) & (np.diff(period) == 1)
+
+    steps = np.abs(np.diff(ratio))
+    assert steps[same].max() < 0.01
+    assert steps[across].max() > 0.02